@@ -113,6 +113,7 @@ const heatmapCall = async (startDate: Date, endDate: Date) => {
             month: startDate.getMonth() + 1,
             eps: 0.001,
             minSamples: 3,
+            mode: "binned",
             startDate: startDate.toISOString(),
             endDate: endDate.toISOString(),
         })
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import time
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+import psycopg2
+import load_route_data_into_db_parallel as route_loader
+import load_stop_data_into_db_parallel as stop_loader
+import simplify_routes
+import useful_sql_queries
+from load_regions import assign_route_regions
+
+DEFAULT_SEED = 42
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+
+# Hubs the synthetic trucks drive between (latitude, longitude), inside and around Utah
+HUBS = [
+    (40.7608, -111.8910),  # Salt Lake City
+    (40.2338, -111.6585),  # Provo
+    (41.2230, -111.9738),  # Ogden
+    (37.0965, -113.5684),  # St. George
+    (36.1699, -115.1398),  # Las Vegas
+    (39.7392, -104.9903),  # Denver
+    (43.6150, -116.2023),  # Boise
+    (33.4484, -112.0740),  # Phoenix
+]
+
+# Server SQL templates (sql/ of the repository). docker-compose mounts them at /app/sql,
+# outside docker they are next to db_worker/
+SQL_DIRS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql')
+]
+
+# Queries from useful_sql_queries.py that only read, written against month_01
+USEFUL_QUERIES = [
+    'all_points_inside_utah', 'from_utah_trucks', 'to_utah_trucks', 'from_utah_routes_summary',
+    'to_utah_routes_summary', 'from_region_routes', 'longest_idle_routes'
+]
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def create_database(conn_params):
+    """Create the benchmark database if it doesn't exist"""
+    conn = get_connection(dict(conn_params, dbname='postgres'))
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (conn_params['dbname'],))
+    if cursor.fetchone() is None:
+        cursor.execute(f'CREATE DATABASE "{conn_params["dbname"]}";')
+        print(f"Created database {conn_params['dbname']}.")
+    cursor.close()
+    conn.close()
+
+def write_synthetic_files(directory, year, month, trucks, routes_per_truck, seed):
+    """Write a deterministic month of route pings and stops in the raw input formats
+
+    Returns the paths of the route and stop files.
+    """
+    rng = np.random.default_rng(seed)
+    month_start = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+    hubs = np.array(HUBS)
+    route_path = os.path.join(directory, f"month_{month:02d}_routes.csv")
+    stop_path = os.path.join(directory, f"month_{month:02d}_stops.csv")
+    stop_counter = 0
+
+    with open(route_path, 'w') as routes, open(stop_path, 'w') as stops:
+        for truck in range(trucks):
+            truck_id = f"id_{1000000000 + truck}"
+            # Routes are separated by more than a day so the loader splits them
+            timestamp = month_start + int(rng.integers(0, 86400))
+            origin = int(rng.integers(len(hubs)))
+            for _ in range(routes_per_truck):
+                destination = int(rng.choice([h for h in range(len(hubs)) if h != origin]))
+                pings = int(rng.integers(120, 600))
+                # Straight line between the hubs with GPS noise, a ping a minute
+                fraction = np.linspace(0, 1, pings)[:, None]
+                positions = hubs[origin] + (hubs[destination] - hubs[origin]) * fraction
+                positions += rng.normal(0, 0.0005, positions.shape)
+                speeds = rng.normal(95, 10, pings).clip(0)
+
+                # Parked at the start: a run of identical pings
+                parked = int(rng.integers(5, 30))
+                positions[:parked] = positions[0]
+                speeds[:parked] = 0
+                valid = rng.random(pings) > 0.02
+
+                times = timestamp + np.arange(pings) * 60
+                for i in range(pings):
+                    routes.write(f"{truck_id};{positions[i, 0]:.6f};{positions[i, 1]:.6f};{times[i]};"
+                                 f"{speeds[i]:.1f};{int(valid[i])}\n")
+                    # A few exact duplicate pings, as in the real feeds
+                    if rng.random() < 0.01:
+                        routes.write(f"{truck_id};{positions[i, 0]:.6f};{positions[i, 1]:.6f};{times[i]};"
+                                     f"{speeds[i]:.1f};{int(valid[i])}\n")
+
+                # The truck stops at the destination
+                stop_counter += 1
+                stop_start = datetime.fromtimestamp(int(times[-1]) + 300, timezone.utc)
+                stop_end = datetime.fromtimestamp(int(times[-1]) + 300 + int(rng.integers(10, 240)) * 60, timezone.utc)
+                lat, lon = hubs[destination] + rng.normal(0, 0.01, 2)
+                stops.write(f"stop_{stop_counter};{stop_counter} Synthetic Way;{lat:.6f};{lon:.6f};"
+                            f"{stop_start:%Y-%m-%d %H:%M:%S};{stop_end:%Y-%m-%d %H:%M:%S}\n")
+
+                timestamp = int(times[-1]) + 86400 + int(rng.integers(3600, 86400))
+                origin = destination
+
+    return route_path, stop_path
+
+def copy_file(conn_params, copy_command, path):
+    """COPY a prepared file through psycopg2, the loaders use psql for the same commands"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    with open(path, 'r') as f:
+        cursor.copy_expert(copy_command, f)
+    rows = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return rows
+
+def load_synthetic_month(conn_params, year, month, trucks, routes_per_truck, seed):
+    """Load a synthetic month through the same transforms, tables and indexes as the real loaders"""
+    with tempfile.TemporaryDirectory() as directory:
+        route_path, stop_path = write_synthetic_files(directory, year, month, trucks, routes_per_truck, seed)
+
+        # Start from empty tables so every run loads the same rows
+        conn = get_connection(conn_params)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        for table in ['routes', 'route_summary', 'route_stats', 'stops', 'route_shapes']:
+            cursor.execute(f"DROP TABLE IF EXISTS month_{month:02d}_{table} CASCADE;")
+        cursor.close()
+        conn.close()
+        route_loader.setup_database(conn_params, month)
+        stop_loader.setup_database(conn_params, month)
+
+        points_file = os.path.join(directory, 'routes.processed')
+        summary_file = os.path.join(directory, 'routes.summary')
+        stats_file = os.path.join(directory, 'routes.stats')
+        route_loader.prepare_temp_files_for_copy(route_path, points_file, 1, summary_file, stats_file)
+        csv_options = "WITH (FORMAT csv, DELIMITER E',', QUOTE '\"', ESCAPE '\\', NULL '\\N')"
+        points = copy_file(conn_params, f"COPY month_{month:02d}_routes (truck_id, location, timestamp, speed, is_valid, collection_date, route_id, dwell_seconds, ping_count) FROM STDIN {csv_options}", points_file)
+        copy_file(conn_params, f"COPY month_{month:02d}_route_summary (route_id, truck_id, start_time, end_time, start_point, end_point, bbox, point_count, distance_km, max_speed) FROM STDIN {csv_options}", summary_file)
+        copy_file(conn_params, f"COPY month_{month:02d}_route_stats (route_id, truck_id, start_time, duration_seconds, distance_km, moving_seconds, idle_seconds, avg_speed, max_speed, avg_moving_speed_kmh, dwell_count, dwell_seconds, longest_dwell_seconds, invalid_ratio) FROM STDIN {csv_options}", stats_file)
+
+        stops_file = os.path.join(directory, 'stops.processed')
+        stop_loader.prepare_temp_files_for_copy(stop_path, stops_file, 1)
+        stops = copy_file(conn_params, f"COPY month_{month:02d}_stops (stop_id, address, location, start_time, end_time, duration_minutes) FROM STDIN WITH (FORMAT csv, DELIMITER E';', QUOTE '\"', ESCAPE '\\', NULL '\\N')", stops_file)
+
+    route_loader.create_indexes(conn_params, month)
+    stop_loader.create_indexes(conn_params, month)
+    assign_route_regions(conn_params, month)
+
+    simplify_routes.setup_database(conn_params, month)
+    for first, last in simplify_routes.get_route_id_ranges(conn_params, month, 1):
+        simplify_routes.simplify_route_range(conn_params, month, first, last, simplify_routes.DEFAULT_TOLERANCES, 1)
+
+    # Later runs compare against baselines of the same data only, see loaded_synthetic()
+    synthetic = {'year': year, 'month': month, 'trucks': trucks, 'routes_per_truck': routes_per_truck, 'seed': seed}
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS benchmark_synthetic (
+        month INT PRIMARY KEY,
+        params JSONB NOT NULL
+    );
+    INSERT INTO benchmark_synthetic (month, params) VALUES (%(month)s, %(params)s)
+    ON CONFLICT (month) DO UPDATE SET params = EXCLUDED.params;
+    """, {'month': month, 'params': json.dumps(synthetic)})
+    cursor.execute("ANALYZE;")
+    cursor.close()
+    conn.close()
+
+    print(f"Loaded synthetic month {month:02d}: {points:,} points, {stops:,} stops")
+
+def loaded_synthetic(conn_params, month):
+    """Parameters the synthetic month was loaded with, or None when it wasn't loaded"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('benchmark_synthetic');")
+    params = None
+    if cursor.fetchone()[0] is not None:
+        cursor.execute("SELECT params FROM benchmark_synthetic WHERE month = %s;", (month,))
+        row = cursor.fetchone()
+        params = row[0] if row else None
+    cursor.close()
+    conn.close()
+    return params
+
+def render_sql(name, **values):
+    """Render sql/<name>.sql, replacing every {{key}} like renderSql() of the server"""
+    directory = next((d for d in SQL_DIRS if os.path.exists(os.path.join(d, f"{name}.sql"))), None)
+    if directory is None:
+        raise FileNotFoundError(f"SQL template {name}.sql not found in {', '.join(SQL_DIRS)}")
+    with open(os.path.join(directory, f"{name}.sql")) as f:
+        template = f.read()
+    return re.sub(r'\{\{(\w+)\}\}', lambda match: str(values[match.group(1)]), template)
+
+def canonical_queries(year, month):
+    """The hot path queries, with the SQL the server and useful_sql_queries.py send
+
+    The server queries are rendered from the templates queries.ts renders (/location,
+    /heatmap raw and binned, /from_utah and /trip_stats), with fixed parameters.
+    """
+    prefix = f"month_{month:02d}"
+    start_date = f"{year}-{month:02d}-01T00:00:00.000Z"
+    end_date = f"{year}-{month:02d}-08T00:00:00.000Z"
+    view = {'table': f"{prefix}_routes", 'west': -112.2, 'south': 40.5, 'east': -111.6, 'north': 41.0}
+    stops = {'table': f"{prefix}_stops", 'start_date': start_date, 'end_date': end_date}
+    from_utah = {'month_prefix': prefix, 'start_utah': '', 'end_utah': 'NOT', 'start_date': start_date, 'end_date': end_date}
+
+    queries = {
+        # /location
+        'location': render_sql('location', **view),
+        # /location with a zoom level (zoom 10)
+        'location_grid': render_sql('location_grid', **view, cell_size=0.0439453125),
+        # /heatmap raw and binned modes
+        'heatmap_raw': render_sql('heatmap_raw', **stops),
+        'heatmap_binned': render_sql('heatmap_binned', **stops, grid_size=0.0143),
+        # /from_utah without and with a zoom level (zoom 8)
+        'from_utah': render_sql('utah_routes', **from_utah, route_points=render_sql('route_points', month_prefix=prefix)),
+        'from_utah_zoom': render_sql('utah_routes', **from_utah, route_points=render_sql(
+            'route_points_zoom', month_prefix=prefix, pixel_degrees=0.0054931640625)),
+        # /trip_stats
+        'trip_stats': render_sql('trip_stats', month_prefix=prefix, start_date=start_date, end_date=end_date,
+                                 truck_filter='', order_by='distance_km')
+    }
+
+    for name in USEFUL_QUERIES:
+        queries[name] = getattr(useful_sql_queries, name).replace('month_01_', f"{prefix}_")
+
+    return {name: query.strip().rstrip(';') for name, query in queries.items()}
+
+def plan_summary(plan):
+    """Shape, index use and row counts of an EXPLAIN (FORMAT JSON) plan tree"""
+    indexes = set()
+    seq_scans = set()
+
+    def walk(node):
+        if 'Index Name' in node:
+            indexes.add(node['Index Name'])
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.add(node['Relation Name'])
+        children = [walk(child) for child in node.get('Plans', [])]
+        return node['Node Type'] + (f"({', '.join(children)})" if children else '')
+
+    shape = walk(plan['Plan'])
+    return {
+        'shape': shape,
+        'indexes': sorted(indexes),
+        'seq_scans': sorted(seq_scans),
+        'rows': plan['Plan']['Actual Rows'],
+        # Buffer counts of the top node include its children
+        'shared_hit_blocks': plan['Plan'].get('Shared Hit Blocks', 0),
+        'shared_read_blocks': plan['Plan'].get('Shared Read Blocks', 0)
+    }
+
+def run_benchmarks(conn_params, queries, runs):
+    """EXPLAIN ANALYZE every query runs times after a warm up run, keeping the median latency"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    results = {}
+
+    for name, query in queries.items():
+        try:
+            latencies = []
+            for run in range(runs + 1):
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+                plan = cursor.fetchone()[0][0]
+                if run > 0:
+                    latencies.append(plan['Planning Time'] + plan['Execution Time'])
+            conn.rollback()
+
+            result = plan_summary(plan)
+            result['latency_ms'] = statistics.median(latencies)
+            results[name] = result
+            print(f"{name}: {result['latency_ms']:.2f} ms, {result['rows']:,} rows, "
+                  f"indexes {result['indexes'] or 'none'}")
+        except psycopg2.Error as e:
+            conn.rollback()
+            results[name] = {'error': str(e).strip()}
+            print(f"{name}: error {str(e).strip()}")
+
+    cursor.close()
+    conn.close()
+    return results
+
+def find_regressions(baseline, results, tolerance, min_delta_ms):
+    """Compare results with a baseline, returning a message per regression"""
+    regressions = []
+    for name, before in baseline['queries'].items():
+        after = results.get(name)
+        if after is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        if 'error' in after:
+            if 'error' not in before:
+                regressions.append(f"{name}: now fails with {after['error']}")
+            continue
+        if 'error' in before:
+            continue
+
+        if after['shape'] != before['shape']:
+            regressions.append(f"{name}: plan changed from {before['shape']} to {after['shape']}")
+        lost = set(before['indexes']) - set(after['indexes'])
+        if lost:
+            regressions.append(f"{name}: no longer uses {sorted(lost)}")
+        new_scans = set(after['seq_scans']) - set(before['seq_scans'])
+        if new_scans:
+            regressions.append(f"{name}: new sequential scans of {sorted(new_scans)}")
+
+        slower = after['latency_ms'] - before['latency_ms']
+        if slower > min_delta_ms and after['latency_ms'] > before['latency_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: {before['latency_ms']:.2f} ms -> {after['latency_ms']:.2f} ms")
+
+        blocks_before = before['shared_hit_blocks'] + before['shared_read_blocks']
+        blocks_after = after['shared_hit_blocks'] + after['shared_read_blocks']
+        if blocks_after > blocks_before * (1 + tolerance) and blocks_after - blocks_before > 100:
+            regressions.append(f"{name}: buffers {blocks_before:,} -> {blocks_after:,}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the canonical queries against a synthetic month and detect regressions')
+    parser.add_argument('--setup', action='store_true', help='(Re)load the synthetic month before benchmarking')
+    parser.add_argument('--year', type=int, default=2023, help='Year of the synthetic data')
+    parser.add_argument('--month', type=int, default=1, help='Month number of the synthetic tables (1-12)')
+    parser.add_argument('--trucks', type=int, default=200, help='Synthetic trucks')
+    parser.add_argument('--routes-per-truck', type=int, default=8, help='Synthetic routes per truck')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Random seed of the synthetic data')
+    parser.add_argument('--runs', type=int, default=5, help='Measured runs per query')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='Baseline JSON to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Slowdowns smaller than this are ignored')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='freight_benchmark', help='Scratch database to benchmark in')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+
+    args = parser.parse_args()
+    # The latency is the median of the measured runs
+    if args.runs < 1:
+        parser.error('--runs must be at least 1')
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    if args.setup:
+        create_database(conn_params)
+        start_time = time.time()
+        load_synthetic_month(conn_params, args.year, args.month, args.trucks, args.routes_per_truck, args.seed)
+        print(f"Setup took {time.time() - start_time:.2f} seconds\n")
+
+    synthetic = loaded_synthetic(conn_params, args.month)
+    if synthetic is None:
+        print(f"No synthetic month {args.month:02d} in {args.dbname}, run with --setup first")
+        raise SystemExit(2)
+
+    results = run_benchmarks(conn_params, canonical_queries(synthetic['year'], args.month), args.runs)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'synthetic': synthetic,
+                'queries': results
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    # Plans and timings of different data can't be compared
+    recorded = baseline.get('synthetic') or {}
+    if recorded != synthetic:
+        print(f"\nThe baseline was recorded on other synthetic data, not comparing:")
+        for key in sorted(set(synthetic) | set(recorded)):
+            if synthetic.get(key) != recorded.get(key):
+                print(f"  {key}: baseline {recorded.get(key)}, loaded {synthetic.get(key)}")
+        print("Reload with matching --setup options or save a new baseline")
+        raise SystemExit(2)
+
+    regressions = find_regressions(baseline, results, args.tolerance, args.min_delta_ms)
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+    print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import time
+import psycopg2
+import concurrent.futures
+import argparse
+import os
+
+# Each tile is split into TILE_CELLS x TILE_CELLS intensity cells
+TILE_CELLS = 64
+# Web mercator cannot represent the poles
+MAX_LATITUDE = 85.05112878
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def setup_database(conn_params):
+    """Create the tile table if it does not exist"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    # cells holds the row-major index (cy * TILE_CELLS + cx) of every non-empty
+    # cell in the tile and counts holds the number of stops in that cell
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS heatmap_tiles (
+        month SMALLINT NOT NULL,
+        z SMALLINT NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        cells INTEGER[] NOT NULL,
+        counts INTEGER[] NOT NULL,
+        max_count INTEGER NOT NULL,
+        PRIMARY KEY (month, z, x, y)
+    );
+    """)
+
+    cursor.close()
+    conn.close()
+
+    print("Tile table ready.")
+
+def build_month_tiles(conn_params, month, min_zoom, max_zoom):
+    """Build every zoom level of the tile pyramid for one month of stops"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    start_time = time.time()
+
+    cursor.execute("DELETE FROM heatmap_tiles WHERE month = %s;", (month,))
+
+    # Count stops per cell at the deepest zoom level in a single pass over the stops.
+    # gx/gy are global cell coordinates: tile coordinate * TILE_CELLS + cell offset.
+    scale = (2 ** max_zoom) * TILE_CELLS
+    cursor.execute(f"""
+    CREATE TEMP TABLE pyramid_cells AS
+    SELECT gx, gy, COUNT(*)::int AS c
+    FROM (
+        SELECT
+            FLOOR((ST_X(location::geometry) + 180) / 360 * %(scale)s)::bigint AS gx,
+            FLOOR((1 - LN(TAN(RADIANS(lat)) + 1 / COS(RADIANS(lat))) / PI()) / 2 * %(scale)s)::bigint AS gy
+        FROM (
+            SELECT location, GREATEST(LEAST(ST_Y(location::geometry), %(max_lat)s), -%(max_lat)s) AS lat
+            FROM month_{month:02d}_stops
+        ) s
+    ) p
+    GROUP BY gx, gy;
+    """, {'scale': scale, 'max_lat': MAX_LATITUDE})
+
+    tiles = 0
+    for z in range(max_zoom, min_zoom - 1, -1):
+        if z < max_zoom:
+            # Each lower zoom level merges 2x2 cells of the level above it
+            cursor.execute("""
+            CREATE TEMP TABLE pyramid_parent AS
+            SELECT gx / 2 AS gx, gy / 2 AS gy, SUM(c)::int AS c
+            FROM pyramid_cells
+            GROUP BY gx / 2, gy / 2;
+            DROP TABLE pyramid_cells;
+            ALTER TABLE pyramid_parent RENAME TO pyramid_cells;
+            """)
+
+        cursor.execute("""
+        INSERT INTO heatmap_tiles (month, z, x, y, cells, counts, max_count)
+        SELECT
+            %(month)s,
+            %(z)s,
+            gx / %(cells)s,
+            gy / %(cells)s,
+            ARRAY_AGG(((gy %% %(cells)s) * %(cells)s + gx %% %(cells)s)::int ORDER BY gy, gx),
+            ARRAY_AGG(c ORDER BY gy, gx),
+            MAX(c)
+        FROM pyramid_cells
+        GROUP BY gx / %(cells)s, gy / %(cells)s;
+        """, {'month': month, 'z': z, 'cells': TILE_CELLS})
+        tiles += cursor.rowcount
+
+    cursor.execute("DROP TABLE pyramid_cells;")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"Month {month:02d}: built {tiles} tiles for zoom {min_zoom}-{max_zoom} in {elapsed:.2f}s")
+    return tiles
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a multi-resolution heatmap tile pyramid from loaded stop data')
+    parser.add_argument('--months', type=int, nargs='+', required=True, help='Month numbers (1-12)')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+    # The defaults match HEATMAP_TILE_MIN_ZOOM / HEATMAP_TILE_MAX_ZOOM in the server's queries.ts
+    parser.add_argument('--min-zoom', type=int, default=3, help='Lowest zoom level to build')
+    parser.add_argument('--max-zoom', type=int, default=14, help='Highest zoom level to build')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of parallel workers (0=auto based on CPU count)')
+
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else min(os.cpu_count(), len(args.months))
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    setup_database(conn_params)
+
+    start_time = time.time()
+    total_tiles = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(build_month_tiles, conn_params, month, args.min_zoom, args.max_zoom)
+            for month in args.months
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            total_tiles += future.result()
+
+    total_time = time.time() - start_time
+    print(f"\nTile pyramid complete!")
+    print(f"Total tiles: {total_tiles:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
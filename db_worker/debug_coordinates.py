@@ -1,4 +1,5 @@
 import os
+import csv
 import psycopg2
 from dotenv import load_dotenv
 from datetime import datetime
@@ -23,25 +24,27 @@ def save_coordinates_to_file(query, output_file):
     """Execute a SQL query and save coordinates to a file"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
         print(f"Executing query...")
+        # A named cursor keeps the result on the server and streams it in batches,
+        # so large results don't have to fit in memory
+        cursor = conn.cursor(name='debug_coordinates')
+        cursor.itersize = 10000
         cursor.execute(query)
         
-        # Fetch results
-        results = cursor.fetchall()
-        
         # Save to file
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{output_file}_{timestamp}.csv"
         
-        with open(filename, 'w') as f:
-            f.write("datetime,longitude,latitude\n")
-            for row in results:
-                # Assuming first column is longitude and second is latitude
-                f.write(f"{row[0]},{row[1]},{row[2]}\n")
+        rows = 0
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["datetime", "longitude", "latitude"])
+            for row in cursor:
+                # Assuming first column is the datetime, then longitude and latitude
+                writer.writerow(row[:3])
+                rows += 1
         
-        print(f"Saved {len(results)} coordinates to {filename}")
+        print(f"Saved {rows} coordinates to {filename}")
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -67,6 +70,17 @@ if __name__ == "__main__":
 #         ST_Y(location::geometry) as latitude
 # FROM ranked_points
 # WHERE rn % 5 = 1;
+# """
+    # Simplified version of a route precomputed by simplify_routes.py (tolerance in degrees)
+#     example_query = """
+# SELECT
+#         to_timestamp(ST_M(p.geom))::timestamp as datetime,
+#         ST_X(p.geom) as longitude,
+#         ST_Y(p.geom) as latitude
+# FROM month_01_route_shapes s
+# CROSS JOIN LATERAL ST_DumpPoints(s.geom) p
+# WHERE s.route_id = 1000001 AND s.tolerance = 0.001
+# ORDER BY p.path[1];
 # """
     example_query = """
     SELECT 
@@ -0,0 +1,322 @@
+import os
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+import psycopg2
+from sqlalchemy import create_engine
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder
+
+DEFAULT_MODEL_PATH = os.path.join('models', 'delivery_model.joblib')
+
+# Columns the model is trained on, in order. The prediction handler builds the same columns.
+CATEGORICAL_FEATURES = ['origin_region_id', 'destination_region_id']
+NUMERIC_FEATURES = ['distance_km', 'start_hour', 'start_weekday', 'corridor_speed_kmh', 'corridor_stop_minutes']
+TARGET = 'duration_hours'
+
+# Corridors with fewer routes than this fall back to the overall median speed
+MIN_CORRIDOR_ROUTES = 5
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def setup_database(conn_params):
+    """Create the feature tables if they don't exist"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    # One row per loaded route. Region 0 means the point is in no region. stop_count and
+    # stop_minutes are NULL when the month's stops aren't linked to routes.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS delivery_features (
+        month INT NOT NULL,
+        route_id INT NOT NULL,
+        origin_region_id INT NOT NULL,
+        destination_region_id INT NOT NULL,
+        distance_km DOUBLE PRECISION NOT NULL,
+        start_hour INT NOT NULL,
+        start_weekday INT NOT NULL,
+        moving_speed_kmh DOUBLE PRECISION,
+        stop_count INT,
+        stop_minutes DOUBLE PRECISION,
+        duration_hours DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (month, route_id)
+    );
+    ALTER TABLE delivery_features ADD COLUMN IF NOT EXISTS stop_count INT;
+    ALTER TABLE delivery_features ADD COLUMN IF NOT EXISTS stop_minutes DOUBLE PRECISION;
+
+    CREATE TABLE IF NOT EXISTS delivery_corridor_speeds (
+        origin_region_id INT NOT NULL,
+        destination_region_id INT NOT NULL,
+        route_count INT NOT NULL,
+        median_speed_kmh DOUBLE PRECISION NOT NULL,
+        median_distance_km DOUBLE PRECISION NOT NULL,
+        median_stop_minutes DOUBLE PRECISION,
+        PRIMARY KEY (origin_region_id, destination_region_id)
+    );
+    ALTER TABLE delivery_corridor_speeds ADD COLUMN IF NOT EXISTS median_stop_minutes DOUBLE PRECISION;
+    """)
+
+    cursor.close()
+    conn.close()
+
+    print("Feature tables ready.")
+
+def get_featurized_months(conn_params):
+    """Return the months that already have rows in delivery_features"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT month FROM delivery_features;")
+    months = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return months
+
+def build_month_features(conn_params, month):
+    """Add the routes of one month to delivery_features"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    start_time = time.time()
+
+    # The stops a route made while driving, linked by link_stops_to_routes.py
+    cursor.execute(f"SELECT to_regclass('month_{month:02d}_stop_routes');")
+    if cursor.fetchone()[0] is not None:
+        stops = f"""
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS stop_count, COALESCE(SUM(st.duration_minutes), 0) AS stop_minutes
+        FROM month_{month:02d}_stop_routes l
+        JOIN month_{month:02d}_stops st ON st.id = l.stop_row_id
+        WHERE l.route_id = s.route_id
+    ) stops ON TRUE"""
+    else:
+        print(f"Month {month:02d}: stops are not linked to routes, run link_stops_to_routes.py for stop features")
+        stops = "\n    CROSS JOIN (SELECT NULL::int AS stop_count, NULL::double precision AS stop_minutes) stops"
+
+    # A route's origin and destination are the smallest regions containing its
+    # end points, so a metro area wins over its state
+    cursor.execute(f"""
+    DELETE FROM delivery_features WHERE month = %(month)s;
+
+    INSERT INTO delivery_features (month, route_id, origin_region_id, destination_region_id, distance_km,
+                                   start_hour, start_weekday, moving_speed_kmh, stop_count, stop_minutes,
+                                   duration_hours)
+    SELECT
+        %(month)s,
+        s.route_id,
+        COALESCE((SELECT r.id FROM regions r WHERE r.id = ANY(s.start_region_ids) ORDER BY ST_Area(r.geom) LIMIT 1), 0),
+        COALESCE((SELECT r.id FROM regions r WHERE r.id = ANY(s.end_region_ids) ORDER BY ST_Area(r.geom) LIMIT 1), 0),
+        s.distance_km,
+        EXTRACT(HOUR FROM TO_TIMESTAMP(s.start_time))::int,
+        EXTRACT(ISODOW FROM TO_TIMESTAMP(s.start_time))::int,
+        st.avg_moving_speed_kmh,
+        stops.stop_count,
+        stops.stop_minutes,
+        (s.end_time - s.start_time) / 3600.0
+    FROM month_{month:02d}_route_summary s
+    LEFT JOIN month_{month:02d}_route_stats st ON st.route_id = s.route_id{stops}
+    -- single point routes have no duration to learn from
+    WHERE s.end_time > s.start_time;
+    """, {'month': month})
+    rows = cursor.rowcount
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"Month {month:02d}: {rows:,} feature rows in {elapsed:.2f}s")
+    return rows
+
+def refresh_corridor_speeds(conn_params):
+    """Recompute the historical speed of every origin/destination corridor"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+    DELETE FROM delivery_corridor_speeds;
+
+    INSERT INTO delivery_corridor_speeds (origin_region_id, destination_region_id, route_count, median_speed_kmh,
+                                          median_distance_km, median_stop_minutes)
+    SELECT
+        origin_region_id,
+        destination_region_id,
+        COUNT(*),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY distance_km / duration_hours),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY distance_km),
+        -- NULL for routes of months without linked stops, which PERCENTILE_CONT skips
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY stop_minutes)
+    FROM delivery_features
+    GROUP BY origin_region_id, destination_region_id;
+    """)
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print("Corridor speeds refreshed.")
+
+def corridor_stats(features):
+    """Route count and median speed, distance and stop time per corridor, like delivery_corridor_speeds"""
+    features = features.assign(speed_kmh=features['distance_km'] / features[TARGET],
+                               stop_minutes=features['stop_minutes'].astype(float))
+    return features.groupby(['origin_region_id', 'destination_region_id']).agg(
+        route_count=('speed_kmh', 'size'),
+        median_speed_kmh=('speed_kmh', 'median'),
+        median_distance_km=('distance_km', 'median'),
+        median_stop_minutes=('stop_minutes', 'median')
+    ).reset_index()
+
+def default_stop_minutes(features):
+    """Median stop time of a route, 0 when no month has linked stops"""
+    median = features['stop_minutes'].astype(float).median()
+    return 0.0 if np.isnan(median) else float(median)
+
+def with_corridor_features(features, corridors, defaults):
+    """Model input columns of features, with each route's corridor speed and stop time looked up
+
+    A trip's own stops aren't known before it departs, so stops enter the model as the
+    historical stop time of the corridor, like its speed.
+    """
+    keys = list(zip(features['origin_region_id'], features['destination_region_id']))
+    speeds, stop_minutes = corridors
+    X = features.assign(
+        corridor_speed_kmh=[speeds.get(key, defaults['speed_kmh']) for key in keys],
+        corridor_stop_minutes=[stop_minutes.get(key, defaults['stop_minutes']) for key in keys]
+    )
+    return X[CATEGORICAL_FEATURES + NUMERIC_FEATURES]
+
+def corridor_tables(corridors):
+    """Lookup tables of corridor speeds, distances and stop times keyed by (origin, destination)"""
+    reliable = corridors[corridors['route_count'] >= MIN_CORRIDOR_ROUTES]
+    keys = list(zip(reliable['origin_region_id'].astype(int), reliable['destination_region_id'].astype(int)))
+    speeds = dict(zip(keys, reliable['median_speed_kmh'].astype(float)))
+    distances = dict(zip(keys, reliable['median_distance_km'].astype(float)))
+    # Corridors whose routes have no linked stops use the default
+    stop_minutes = {key: minutes for key, minutes in zip(keys, reliable['median_stop_minutes'].astype(float))
+                    if not np.isnan(minutes)}
+    return speeds, distances, stop_minutes
+
+def train(conn_params, model_path):
+    """Train the duration model on delivery_features and save it with its lookup tables"""
+    engine = create_engine(
+        f"postgresql+psycopg2://{conn_params['user']}:{conn_params['password']}@{conn_params['host']}:{conn_params['port']}/{conn_params['dbname']}"
+    )
+    features = pd.read_sql_query("SELECT * FROM delivery_features;", engine)
+    corridors = pd.read_sql_query("SELECT * FROM delivery_corridor_speeds;", engine)
+
+    if features.empty:
+        print("No feature rows, nothing to train on.")
+        return
+
+    # The corridor features are medians over routes, the speed one of route targets, so
+    # for the holdout error they are computed from the training rows only
+    train_rows, test_rows = train_test_split(features, test_size=0.2, random_state=0)
+    train_speeds, _, train_stop_minutes = corridor_tables(corridor_stats(train_rows))
+    train_defaults = {
+        'speed_kmh': float(np.median(train_rows['distance_km'] / train_rows[TARGET])),
+        'stop_minutes': default_stop_minutes(train_rows)
+    }
+    X_train = with_corridor_features(train_rows, (train_speeds, train_stop_minutes), train_defaults)
+    X_test = with_corridor_features(test_rows, (train_speeds, train_stop_minutes), train_defaults)
+    y_train, y_test = train_rows[TARGET], test_rows[TARGET]
+
+    # Region ids are categories. Rare ones are grouped so the encoded values fit
+    # the booster's bins, regions unseen in training are treated as missing.
+    model = Pipeline([
+        ('encode', ColumnTransformer(
+            [('regions', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=np.nan,
+                                        max_categories=250), CATEGORICAL_FEATURES)],
+            remainder='passthrough'
+        )),
+        ('regress', HistGradientBoostingRegressor(
+            loss='absolute_error',
+            categorical_features=[0, 1],
+            random_state=0
+        ))
+    ])
+
+    start_time = time.time()
+    model.fit(X_train, y_train)
+    elapsed = time.time() - start_time
+    mae = mean_absolute_error(y_test, model.predict(X_test))
+    print(f"Trained on {len(X_train):,} routes in {elapsed:.2f}s, holdout MAE {mae:.2f} hours")
+
+    # Refit on everything now that the holdout error is known, with the corridor
+    # features of all routes (delivery_corridor_speeds) that predictions will use
+    corridor_speeds, corridor_distances, corridor_stop_minutes = corridor_tables(corridors)
+    defaults = {
+        'speed_kmh': float(np.median(features['distance_km'] / features[TARGET])),
+        'stop_minutes': default_stop_minutes(features)
+    }
+    model.fit(with_corridor_features(features, (corridor_speeds, corridor_stop_minutes), defaults), features[TARGET])
+
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+    joblib.dump({
+        'model': model,
+        'corridor_speeds': corridor_speeds,
+        'corridor_distances': corridor_distances,
+        'corridor_stop_minutes': corridor_stop_minutes,
+        'default_speed_kmh': defaults['speed_kmh'],
+        'default_stop_minutes': defaults['stop_minutes'],
+        'default_distance_km': float(features['distance_km'].median()),
+        'holdout_mae_hours': float(mae),
+        'trained_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'training_rows': len(features)
+    }, model_path)
+    print(f"Model saved to {model_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Build delivery time features and train the prediction model')
+    parser.add_argument('--months', type=int, nargs='*', default=[], help='Loaded months to add to the feature table')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild features of months that already have them')
+    parser.add_argument('--train', action='store_true', help='Train and save the model after building features')
+    parser.add_argument('--model-path', type=str, default=os.getenv('DELIVERY_MODEL_PATH', DEFAULT_MODEL_PATH),
+                        help='Where to save the trained model')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+
+    args = parser.parse_args()
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    setup_database(conn_params)
+
+    done = set() if args.rebuild else get_featurized_months(conn_params)
+    months = [month for month in args.months if month not in done]
+    if len(months) < len(args.months):
+        print(f"Skipping months that already have features: {sorted(set(args.months) - set(months))}")
+
+    start_time = time.time()
+    total_rows = 0
+    for month in months:
+        total_rows += build_month_features(conn_params, month)
+
+    if months:
+        refresh_corridor_speeds(conn_params)
+
+    total_time = time.time() - start_time
+    print(f"\nFeatures complete!")
+    print(f"Total rows: {total_rows:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+
+    if args.train:
+        train(conn_params, args.model_path)
+
+if __name__ == "__main__":
+    main()
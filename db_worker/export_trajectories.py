@@ -0,0 +1,250 @@
+import os
+import csv
+import json
+import time
+import argparse
+import concurrent.futures
+from datetime import timedelta
+import psycopg2
+
+# Rows fetched from the server-side cursor, and rows per Parquet row group
+DEFAULT_BATCH_SIZE = 50000
+
+COLUMNS = ['truck_id', 'route_id', 'timestamp', 'latitude', 'longitude', 'speed', 'is_valid']
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def get_route_days(conn_params, month):
+    """Return every day between the first and last collection date of the month's routes"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(collection_date), MAX(collection_date) FROM month_{month:02d}_routes;")
+    first_day, last_day = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if first_day is None:
+        return []
+    return [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+def day_query(month, day, partition, truck_id=None, route_id=None):
+    """SQL and parameters selecting the points of one day, ordered so partitions arrive one after another"""
+    filters = ["collection_date = %(day)s"]
+    if truck_id:
+        filters.append("truck_id = %(truck_id)s")
+    if route_id:
+        filters.append("route_id = %(route_id)s")
+    order = f"{partition}_id, timestamp" if partition != 'none' else "timestamp"
+
+    return f"""
+    SELECT
+        truck_id,
+        route_id,
+        timestamp,
+        ST_Y(location::geometry) AS latitude,
+        ST_X(location::geometry) AS longitude,
+        speed::double precision AS speed,
+        is_valid
+    FROM month_{month:02d}_routes
+    WHERE {' AND '.join(filters)}
+    ORDER BY {order}
+    """, {'day': day, 'truck_id': truck_id, 'route_id': route_id}
+
+class CsvWriter:
+    extension = 'csv'
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class GeoJsonWriter:
+    """Newline-delimited GeoJSON, one Point feature per line"""
+    extension = 'geojsonl'
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, rows):
+        lines = []
+        for truck_id, route_id, timestamp, latitude, longitude, speed, is_valid in rows:
+            lines.append(json.dumps({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+                'properties': {'truck_id': truck_id, 'route_id': route_id, 'timestamp': timestamp,
+                               'speed': speed, 'is_valid': is_valid}
+            }))
+        self.file.write('\n'.join(lines) + '\n')
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Parquet with one row group per batch, needs pyarrow"""
+    extension = 'parquet'
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, install db_worker/requirements.txt")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('truck_id', pa.string()),
+            ('route_id', pa.int32()),
+            ('timestamp', pa.int64()),
+            ('latitude', pa.float64()),
+            ('longitude', pa.float64()),
+            ('speed', pa.float64()),
+            ('is_valid', pa.bool_())
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.table(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {
+    'csv': CsvWriter,
+    'ndjson': GeoJsonWriter,
+    'parquet': ParquetWriter
+}
+
+def export_day(conn_params, month, day, output_dir, output_format, partition, batch_size, truck_id=None, route_id=None):
+    """Export the points of one day, returning the number of rows written"""
+    conn = get_connection(conn_params)
+    start_time = time.time()
+    query, params = day_query(month, day, partition, truck_id, route_id)
+    writer_class = WRITERS[output_format]
+    rows = 0
+
+    if output_format == 'csv' and partition == 'none':
+        # The server formats the CSV, nothing is held in memory on this side
+        path = os.path.join(output_dir, f"month_{month:02d}_{day}.csv")
+        cursor = conn.cursor()
+        query = cursor.mogrify(query, params).decode()
+        with open(path, 'w') as f:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        rows = cursor.rowcount
+        cursor.close()
+    else:
+        # A named cursor streams the result in batches instead of fetching it whole.
+        # Rows arrive grouped by partition, so only one output file is open at a time.
+        cursor = conn.cursor(name=f"export_{month:02d}_{day:%Y%m%d}")
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+
+        key_index = COLUMNS.index(f"{partition}_id") if partition != 'none' else None
+        writer = None
+        current_key = None
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            rows += len(batch)
+
+            start = 0
+            while start < len(batch):
+                key = batch[start][key_index] if key_index is not None else None
+                end = start
+                while end < len(batch) and (key_index is None or batch[end][key_index] == key):
+                    end += 1
+
+                if writer is None or key != current_key:
+                    if writer is not None:
+                        writer.close()
+                    if key_index is None:
+                        path = os.path.join(output_dir, f"month_{month:02d}_{day}.{writer_class.extension}")
+                    else:
+                        partition_dir = os.path.join(output_dir, f"{partition}={key}")
+                        os.makedirs(partition_dir, exist_ok=True)
+                        path = os.path.join(partition_dir, f"month_{month:02d}_{day}.{writer_class.extension}")
+                    writer = writer_class(path)
+                    current_key = key
+
+                writer.write(batch[start:end])
+                start = end
+
+        if writer is not None:
+            writer.close()
+        cursor.close()
+
+    conn.close()
+
+    elapsed = time.time() - start_time
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"{day}: exported {rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream route points out of the database as CSV, Parquet or GeoJSON')
+    parser.add_argument('--month', type=int, required=True, help='Month number (1-12)')
+    parser.add_argument('--format', choices=list(WRITERS), default='csv',
+                        help='Output format, ndjson writes one GeoJSON Point feature per line')
+    parser.add_argument('--partition', choices=['none', 'truck', 'route'], default='none',
+                        help='Write a directory per truck or route')
+    parser.add_argument('--truck-id', type=str, help='Only export this truck')
+    parser.add_argument('--route-id', type=int, help='Only export this route')
+    parser.add_argument('--output-dir', type=str, default='exports', help='Directory to write files to')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows per fetched batch')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of parallel workers (0=auto based on CPU count)')
+
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    days = get_route_days(conn_params, args.month)
+    print(f"Exporting {len(days)} days as {args.format} with {workers} workers...")
+    start_time = time.time()
+    total_rows = 0
+
+    # Each day goes to its own files, so workers never write to the same file
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(export_day, conn_params, args.month, day, args.output_dir, args.format,
+                            args.partition, args.batch_size, args.truck_id, args.route_id)
+            for day in days
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            total_rows += future.result()
+
+    total_time = time.time() - start_time
+    avg_rate = total_rows / total_time if total_time > 0 else 0
+    print(f"\nExport complete!")
+    print(f"Total rows: {total_rows:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+    print(f"Average rate: {avg_rate:,.0f} rows/second")
+
+if __name__ == "__main__":
+    main()
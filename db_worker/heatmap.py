@@ -1,45 +1,99 @@
+import os
+import time
+import argparse
+import concurrent.futures
 import pandas as pd
 import numpy as np
 from sklearn.cluster import DBSCAN
-from collections import Counter
 
 
-def create_heatmap_csv(file_path, month, year):
-    df = pd.read_csv(file_path, sep=';', names=['id', 'location', 'latitude', 'longitude', 'arrival_date', 'leaving_date', 'idk'])
+def create_heatmap_csv(file_path, month, year, eps=0.001, min_samples=2, output_dir='.', output_name=None):
+    # Only the coordinates are used, so skip parsing the other columns
+    df = pd.read_csv(file_path, sep=';', header=None, usecols=[2, 3], names=['latitude', 'longitude'],
+                     dtype={'latitude': np.float64, 'longitude': np.float64})
     total_counts = len(df)
-    # Convert latitude and longitude to floats
-    df['latitude'] = pd.to_numeric(df['latitude'])
-    df['longitude'] = pd.to_numeric(df['longitude'])
 
     # Extract necessary columns
-    coordinates = df[['latitude', 'longitude']].values
+    coordinates = df[['latitude', 'longitude']].to_numpy()
 
     # Apply DBSCAN clustering
-    eps = 0.001  # Adjust based on your data, eps values: 1=111km, .001=111m, .01=1.11km
-    min_samples = 2  # Adjust based on desired minimum stop count
+    # eps values: 1=111km, .001=111m, .01=1.11km
+    # min_samples: minimum stop count for a cluster
     db = DBSCAN(eps=eps, min_samples=min_samples, metric='haversine').fit(np.radians(coordinates))
 
-    # Assign cluster labels
-    df['cluster'] = db.labels_
-
-    # Count stops per cluster
-    cluster_counts = Counter(df['cluster'])
-    max_count = max(cluster_counts.values())
+    # Count stops per cluster, -1 is noise
+    labels = db.labels_
+    clustered = labels != -1
+    cluster_ids = labels[clustered]
+    counts = np.bincount(cluster_ids)
+    max_count = max(counts.max() if counts.size else 0, np.count_nonzero(~clustered))
 
     # Compute intensity (normalized stop count)
-    heatmap_data = []
-    for cluster, count in cluster_counts.items():
-        if cluster == -1:  # Ignore noise points
-            continue
-        cluster_points = df[df['cluster'] == cluster]
-        avg_lat = cluster_points['latitude'].mean()
-        avg_lon = cluster_points['longitude'].mean()
-        intensity = count / max_count
-        heatmap_data.append((avg_lat, avg_lon, intensity))
+    nonempty = counts > 0
+    avg_lat = np.bincount(cluster_ids, weights=coordinates[clustered, 0])[nonempty] / counts[nonempty]
+    avg_lon = np.bincount(cluster_ids, weights=coordinates[clustered, 1])[nonempty] / counts[nonempty]
+    intensity = counts[nonempty] / max_count
 
     # Convert to DataFrame for visualization
-    heatmap_df = pd.DataFrame(heatmap_data, columns=['latitude', 'longitude', 'intensity'])
+    heatmap_df = pd.DataFrame({'latitude': avg_lat, 'longitude': avg_lon, 'intensity': intensity})
 
-    heatmap_df.to_csv(f"heatmap-{month}-{year}.csv", index=False)
+    output_name = output_name or f"heatmap-{month}-{year}"
+    heatmap_df.to_csv(os.path.join(output_dir, f"{output_name}.csv"), index=False)
+    # Binary copy for tools that load heatmaps programmatically
+    np.savez_compressed(os.path.join(output_dir, f"{output_name}.npz"),
+                        latitude=avg_lat, longitude=avg_lon, intensity=intensity, count=counts[nonempty])
 
     return total_counts, max_count
+
+
+def create_heatmap_job(file_path, month, year, eps, min_samples, output_dir, output_name):
+    """Run create_heatmap_csv and time it"""
+    start_time = time.time()
+    total_counts, max_count = create_heatmap_csv(file_path, month, year, eps, min_samples, output_dir, output_name)
+    elapsed = time.time() - start_time
+    print(f"{output_name}: {total_counts:,} stops, max cluster {max_count:,} in {elapsed:.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate heatmaps for many months and eps values in parallel')
+    parser.add_argument('--year', type=int, required=True, help='Year of the data, used in output file names')
+    parser.add_argument('--months', type=int, nargs='+', default=list(range(1, 13)), help='Month numbers (1-12)')
+    parser.add_argument('--eps', type=float, nargs='+', default=[0.001], help='DBSCAN eps values')
+    parser.add_argument('--min-samples', type=int, default=2, help='Minimum stop count for a cluster')
+    parser.add_argument('--input-dir', type=str, default='monthly_stop_data', help='Directory with month_XX.csv stop files')
+    parser.add_argument('--output-dir', type=str, default='.', help='Directory to write heatmaps to')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of parallel workers (0=auto based on CPU count)')
+
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = []
+    for month in args.months:
+        file_path = os.path.join(args.input_dir, f"month_{month:02d}.csv")
+        if not os.path.exists(file_path):
+            print(f"Skipping month {month}: file {file_path} does not exist")
+            continue
+        for eps in args.eps:
+            # Keep the single-eps file name that create_heatmap_csv has always used
+            output_name = f"heatmap-{month}-{args.year}" if len(args.eps) == 1 else f"heatmap-{month}-{args.year}-eps{eps:g}"
+            jobs.append((file_path, month, args.year, eps, args.min_samples, args.output_dir, output_name))
+
+    print(f"Generating {len(jobs)} heatmaps with {workers} workers...")
+    start_time = time.time()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(create_heatmap_job, *job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    total_time = time.time() - start_time
+    print(f"\nHeatmaps complete!")
+    print(f"Total time: {total_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import time
+import psycopg2
+import concurrent.futures
+import argparse
+import os
+from materialize_heatmap_summaries import get_month_days
+
+# A stop is linked to a route with points within this distance of the stop...
+DEFAULT_RADIUS_M = 200.0
+# ...recorded between the stop's start and end time, widened by this many seconds
+DEFAULT_TIME_SLACK = 600
+# Days linked at once. Each day is one spatial join in the database, more in
+# parallel mostly compete for the same disks.
+DEFAULT_WORKERS = 4
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def setup_database(conn_params, month):
+    """Create the stop to route link table if it does not exist"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    # One row per linked stop, keyed by month_XX_stops.id. Stops without a
+    # matching route have no row.
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS month_{month:02d}_stop_routes (
+        stop_row_id INT PRIMARY KEY,
+        route_id INT NOT NULL,
+        truck_id VARCHAR(50) NOT NULL,
+        matched_points INT NOT NULL,
+        distance_m DOUBLE PRECISION NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_stop_routes_route_id_{month:02d} ON month_{month:02d}_stop_routes(route_id);
+    CREATE INDEX IF NOT EXISTS idx_stop_routes_truck_id_{month:02d} ON month_{month:02d}_stop_routes(truck_id);
+    """)
+
+    cursor.close()
+    conn.close()
+
+    print("Stop route table ready.")
+
+def link_day(conn_params, month, day, radius_m, time_slack):
+    """Link the stops starting on one day to the route with the most points near each stop
+
+    Matching runs in the database: for each stop, the GiST index on location finds
+    the route points within radius_m, which are then filtered to the stop's time
+    window. Only the candidate points of one stop are looked at a time, so memory
+    does not grow with the size of the day.
+    """
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    start_time = time.time()
+
+    # Replace the day's links so the script can be rerun with other parameters.
+    # The route with the most nearby points wins, ties go to the closest one.
+    cursor.execute(f"""
+    DELETE FROM month_{month:02d}_stop_routes l
+    USING month_{month:02d}_stops s
+    WHERE l.stop_row_id = s.id
+    AND s.start_time >= %(day)s AND s.start_time < %(day)s + INTERVAL '1 day';
+
+    INSERT INTO month_{month:02d}_stop_routes (stop_row_id, route_id, truck_id, matched_points, distance_m)
+    SELECT DISTINCT ON (s.id) s.id, c.route_id, c.truck_id, c.matched_points, c.distance_m
+    FROM month_{month:02d}_stops s
+    CROSS JOIN LATERAL (
+        SELECT r.route_id, r.truck_id, SUM(r.ping_count) AS matched_points, MIN(ST_Distance(r.location, s.location)) AS distance_m
+        FROM month_{month:02d}_routes r
+        WHERE ST_DWithin(r.location, s.location, %(radius)s)
+        -- A point collapsed by --collapse-stationary stands for its whole dwell
+        AND r.timestamp <= EXTRACT(EPOCH FROM s.end_time)::bigint + %(slack)s
+        AND r.timestamp + r.dwell_seconds >= EXTRACT(EPOCH FROM s.start_time)::bigint - %(slack)s
+        AND r.route_id IS NOT NULL
+        GROUP BY r.route_id, r.truck_id
+    ) c
+    WHERE s.start_time >= %(day)s AND s.start_time < %(day)s + INTERVAL '1 day'
+    ORDER BY s.id, c.matched_points DESC, c.distance_m;
+    """, {'day': day, 'radius': radius_m, 'slack': time_slack})
+    links = cursor.rowcount
+
+    cursor.execute(f"""
+    SELECT COUNT(*) FROM month_{month:02d}_stops
+    WHERE start_time >= %(day)s AND start_time < %(day)s + INTERVAL '1 day';
+    """, {'day': day})
+    stops = cursor.fetchone()[0]
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"{day}: linked {links:,} of {stops:,} stops in {elapsed:.2f}s")
+    return stops, links
+
+def main():
+    parser = argparse.ArgumentParser(description='Link stops to the routes that made them')
+    parser.add_argument('--month', type=int, required=True, help='Month number (1-12)')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS_M,
+                        help='Maximum distance in meters between a stop and route points')
+    parser.add_argument('--time-slack', type=int, default=DEFAULT_TIME_SLACK,
+                        help='Seconds added before and after the stop when looking for route points')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Number of days linked in parallel')
+
+    args = parser.parse_args()
+
+    workers = max(1, min(args.workers, os.cpu_count()))
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    setup_database(conn_params, args.month)
+
+    days = get_month_days(conn_params, args.month)
+    print(f"Linking stops of {len(days)} days with {workers} workers...")
+    start_time = time.time()
+    total_stops = 0
+    total_links = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(link_day, conn_params, args.month, day, args.radius, args.time_slack)
+            for day in days
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            stops, links = future.result()
+            total_stops += stops
+            total_links += links
+
+    total_time = time.time() - start_time
+    print(f"\nLinking complete!")
+    print(f"Linked stops: {total_links:,} of {total_stops:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
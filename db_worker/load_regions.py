@@ -0,0 +1,130 @@
+import json
+import psycopg2
+import argparse
+
+# Regions available without loading any GeoJSON. The Utah polygon follows the
+# state line, including the notch in the north east corner.
+BUILTIN_REGIONS = [
+    {
+        'name': 'Utah',
+        'kind': 'state',
+        'geometry': {
+            'type': 'Polygon',
+            'coordinates': [[
+                [-114.0525, 42.0017], [-111.0466, 42.0017], [-111.0466, 40.9977],
+                [-109.0452, 40.9977], [-109.0452, 36.9990], [-114.0500, 36.9990],
+                [-114.0525, 42.0017]
+            ]]
+        }
+    }
+]
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def setup_regions_table(cursor):
+    """Create the regions table and its spatial index if they don't exist"""
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS regions (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        geom GEOMETRY(MULTIPOLYGON, 4326) NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_regions_geom ON regions USING GIST(geom);
+    """)
+
+    # Built-in regions are only added if missing so loaded GeoJSON can replace them
+    for region in BUILTIN_REGIONS:
+        cursor.execute("""
+        INSERT INTO regions (name, kind, geom)
+        VALUES (%s, %s, ST_Multi(ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326)))
+        ON CONFLICT (name) DO NOTHING;
+        """, (region['name'], region['kind'], json.dumps(region['geometry'])))
+
+def upsert_region(cursor, name, kind, geometry):
+    """Insert a region or replace the geometry of an existing region with the same name"""
+    cursor.execute("""
+    INSERT INTO regions (name, kind, geom)
+    VALUES (%s, %s, ST_Multi(ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326)))
+    ON CONFLICT (name) DO UPDATE SET kind = EXCLUDED.kind, geom = EXCLUDED.geom;
+    """, (name, kind, json.dumps(geometry)))
+
+def assign_route_regions(conn_params, month):
+    """Store the regions containing the start and end point of every route in the month"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    setup_regions_table(cursor)
+
+    # A point can be inside several regions (a metro area and its state), so the
+    # memberships are arrays. GIN indexes make @> ARRAY[region_id] an index lookup.
+    cursor.execute(f"""
+    ALTER TABLE month_{month:02d}_route_summary ADD COLUMN IF NOT EXISTS start_region_ids INT[];
+    ALTER TABLE month_{month:02d}_route_summary ADD COLUMN IF NOT EXISTS end_region_ids INT[];
+
+    UPDATE month_{month:02d}_route_summary s
+    SET start_region_ids = ARRAY(SELECT r.id FROM regions r WHERE ST_Intersects(r.geom, s.start_point)),
+        end_region_ids = ARRAY(SELECT r.id FROM regions r WHERE ST_Intersects(r.geom, s.end_point));
+
+    CREATE INDEX IF NOT EXISTS idx_route_summary_start_regions_{month:02d} ON month_{month:02d}_route_summary USING GIN(start_region_ids);
+    CREATE INDEX IF NOT EXISTS idx_route_summary_end_regions_{month:02d} ON month_{month:02d}_route_summary USING GIN(end_region_ids);
+    """)
+
+    cursor.close()
+    conn.close()
+    print(f"Assigned regions to routes of month {month:02d}.")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load region polygons and assign route origins/destinations to them')
+    parser.add_argument('--geojson', type=str, help='GeoJSON FeatureCollection of Polygon/MultiPolygon regions')
+    parser.add_argument('--name-property', type=str, default='name', help='Feature property holding the region name')
+    parser.add_argument('--kind', type=str, default='custom', help='Kind of the loaded regions (state, metro, geofence, ...)')
+    parser.add_argument('--months', type=int, nargs='*', default=[],
+                        help='Already loaded months to reassign route regions for')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+
+    args = parser.parse_args()
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    setup_regions_table(cursor)
+
+    loaded = 0
+    if args.geojson:
+        with open(args.geojson, 'r') as f:
+            features = json.load(f)['features']
+        for feature in features:
+            name = feature['properties'].get(args.name_property)
+            if not name:
+                print(f"Skipping feature without a '{args.name_property}' property")
+                continue
+            upsert_region(cursor, name, args.kind, feature['geometry'])
+            loaded += 1
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"Loaded {loaded} regions.")
+
+    # Changing regions invalidates the stored memberships
+    for month in args.months:
+        assign_route_regions(conn_params, month)
+
+if __name__ == "__main__":
+    main()
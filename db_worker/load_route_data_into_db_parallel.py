@@ -7,6 +7,18 @@ import subprocess
 import argparse
 import tempfile
 import math
+import numpy as np
+from load_regions import assign_route_regions
+from tile_cache import invalidate_tile_cache
+from trajectory_codec import encode_track, track_copy_line, create_tracks_table_sql, create_track_points_view_sql, DECODE_FUNCTION_SQL
+
+EARTH_RADIUS_KM = 6371.0088
+# A segment between two pings is moving when the truck covers ground faster than this
+MOVING_SPEED_KMH = 5.0
+# Consecutive idle segments lasting at least this long are a dwell (a stop along the trip)
+DWELL_MIN_SECONDS = 300
+# Point reduction applied to month_XX_routes when no options are given: keep every ping
+NO_REDUCTION = {'dedupe': False, 'invalid': 'flag', 'stationary_radius': None}
 
 def split_file_into_chunks(file_path, num_chunks):
     """Split a large file into chunks at route boundaries and return temp file paths"""
@@ -101,7 +113,7 @@ def split_file_into_chunks(file_path, num_chunks):
     
     return temp_files
 
-def setup_database(conn_params, month):
+def setup_database(conn_params, month, layout='points'):
     """Setup database schema and extensions"""
     conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
     print(conn_string)
@@ -122,25 +134,191 @@ def setup_database(conn_params, month):
         speed NUMERIC,
         is_valid BOOLEAN NOT NULL,
         collection_date DATE NOT NULL,
-        route_id INT
+        route_id INT,
+        dwell_seconds INT NOT NULL DEFAULT 0,
+        ping_count INT NOT NULL DEFAULT 1
+    );
+    ALTER TABLE month_{month:02d}_routes ADD COLUMN IF NOT EXISTS dwell_seconds INT NOT NULL DEFAULT 0;
+    ALTER TABLE month_{month:02d}_routes ADD COLUMN IF NOT EXISTS ping_count INT NOT NULL DEFAULT 1;
+    """)
+    
+    # One row per route, written by the transform so route level queries
+    # don't have to window over every point of month_XX_routes
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS month_{month:02d}_route_summary (
+        route_id INT PRIMARY KEY,
+        truck_id VARCHAR(50) NOT NULL,
+        start_time BIGINT NOT NULL,
+        end_time BIGINT NOT NULL,
+        start_point GEOMETRY(POINT, 4326) NOT NULL,
+        end_point GEOMETRY(POINT, 4326) NOT NULL,
+        bbox GEOMETRY(POLYGON, 4326) NOT NULL,
+        point_count INT NOT NULL,
+        distance_km DOUBLE PRECISION NOT NULL,
+        max_speed DOUBLE PRECISION,
+        start_region_ids INT[],
+        end_region_ids INT[]
+    );
+    """)
+    
+    # Per-route trip statistics, also written by the transform
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS month_{month:02d}_route_stats (
+        route_id INT PRIMARY KEY,
+        truck_id VARCHAR(50) NOT NULL,
+        start_time BIGINT NOT NULL,
+        duration_seconds BIGINT NOT NULL,
+        distance_km DOUBLE PRECISION NOT NULL,
+        moving_seconds BIGINT NOT NULL,
+        idle_seconds BIGINT NOT NULL,
+        avg_speed DOUBLE PRECISION,
+        max_speed DOUBLE PRECISION,
+        avg_moving_speed_kmh DOUBLE PRECISION,
+        dwell_count INT NOT NULL,
+        dwell_seconds BIGINT NOT NULL,
+        longest_dwell_seconds BIGINT NOT NULL,
+        invalid_ratio DOUBLE PRECISION NOT NULL
     );
     """)
     
+    # Compact layout: one row per route with delta encoded point arrays,
+    # see trajectory_codec.py
+    if layout != 'points':
+        cursor.execute(create_tracks_table_sql(month))
+        cursor.execute(DECODE_FUNCTION_SQL)
+        cursor.execute(create_track_points_view_sql(month))
+    
     cursor.close()
     conn.close()
     
     print("Database schema ready.")
 
-def prepare_temp_files_for_copy(input_file, output_file, worker_id):
-    """Process input file to create a COPY-compatible format with transformed data"""
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great circle distance in km between arrays of points"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def new_route_buffer(route_id, truck_id):
+    """Points of a route that is still being read"""
+    return {'route_id': route_id, 'truck_id': truck_id, 'timestamps': [], 'latitudes': [], 'longitudes': [], 'speeds': [], 'valid': [], 'seen': set()}
+
+def route_arrays(route):
+    """Return the timestamps, latitudes, longitudes, speeds and valid flags of a route sorted by time"""
+    timestamps = np.array(route['timestamps'], dtype=np.int64)
+    latitudes = np.array(route['latitudes'], dtype=np.float64)
+    longitudes = np.array(route['longitudes'], dtype=np.float64)
+    speeds = np.array(route['speeds'], dtype=np.float64)
+    valid = np.array(route['valid'], dtype=bool)
+
+    # Points arrive in file order, which is not guaranteed to be time order
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], latitudes[order], longitudes[order], speeds[order], valid[order]
+
+def summarize_route(route):
+    """Return the COPY line for a route's row in month_XX_route_summary"""
+    timestamps, latitudes, longitudes, speeds, _ = route_arrays(route)
+
+    distance = haversine_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]).sum()
+    max_speed = np.nanmax(speeds) if not np.isnan(speeds).all() else '\\N'
+
+    west, east = longitudes.min(), longitudes.max()
+    south, north = latitudes.min(), latitudes.max()
+    start_point = f"SRID=4326;POINT({longitudes[0]} {latitudes[0]})"
+    end_point = f"SRID=4326;POINT({longitudes[-1]} {latitudes[-1]})"
+    bbox = f"SRID=4326;POLYGON(({west} {south},{west} {north},{east} {north},{east} {south},{west} {south}))"
+
+    return (f"{route['route_id']},{route['truck_id']},{timestamps[0]},{timestamps[-1]},"
+            f"{start_point},{end_point},\"{bbox}\",{len(timestamps)},{distance},{max_speed}\n")
+
+def route_stats(route):
+    """Return the COPY line for a route's row in month_XX_route_stats"""
+    timestamps, latitudes, longitudes, speeds, valid = route_arrays(route)
+
+    # Per segment between consecutive pings
+    seconds = np.diff(timestamps)
+    distances = haversine_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segment_speeds = np.where(seconds > 0, distances / (seconds / 3600.0), 0.0)
+    moving = segment_speeds >= MOVING_SPEED_KMH
+
+    distance = distances.sum()
+    moving_seconds = int(seconds[moving].sum())
+    idle_seconds = int(seconds[~moving].sum())
+    avg_moving_speed = f"{distance / (moving_seconds / 3600.0)}" if moving_seconds > 0 else '\\N'
+
+    # Dwells are runs of idle segments, found from the edges of the idle mask
+    edges = np.diff(np.concatenate(([0], (~moving).astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    cumulative = np.concatenate(([0], np.cumsum(seconds)))
+    run_seconds = cumulative[run_ends] - cumulative[run_starts]
+    dwells = run_seconds[run_seconds >= DWELL_MIN_SECONDS]
+
+    reported = speeds[~np.isnan(speeds)]
+    avg_speed = reported.mean() if reported.size else '\\N'
+    max_speed = reported.max() if reported.size else '\\N'
+
+    return (f"{route['route_id']},{route['truck_id']},{timestamps[0]},{timestamps[-1] - timestamps[0]},{distance},"
+            f"{moving_seconds},{idle_seconds},{avg_speed},{max_speed},{avg_moving_speed},"
+            f"{len(dwells)},{int(dwells.sum())},{int(dwells.max()) if dwells.size else 0},"
+            f"{1 - valid.mean()}\n")
+
+def write_route(route, summaryfile, statsfile, trackfile, compact):
+    """Write the summary, the trip statistics and, for the compact layout, the encoded track of a completed route"""
+    summaryfile.write(summarize_route(route))
+    statsfile.write(route_stats(route))
+    if compact:
+        track = encode_track(route['timestamps'], route['latitudes'], route['longitudes'], route['speeds'], route['valid'])
+        trackfile.write(track_copy_line(route['route_id'], route['truck_id'], track))
+
+def same_position(run, latitude, longitude, radius_m):
+    """Whether a point is within radius_m meters of where a stationary run started"""
+    if radius_m == 0:
+        return run['latitude'] == latitude and run['longitude'] == longitude
+    # Equirectangular approximation, plenty for distances of a few meters
+    x = math.radians(longitude - run['longitude']) * math.cos(math.radians(latitude))
+    y = math.radians(latitude - run['latitude'])
+    return EARTH_RADIUS_KM * 1000 * math.hypot(x, y) <= radius_m
+
+def point_copy_line(run):
+    """Return the COPY line for a point in month_XX_routes, with the dwell and ping count of its stationary run"""
+    # Format: truck_id, WKT point, timestamp, speed, is_valid, collection_date, route_id, dwell_seconds, ping_count
+    wkt_point = f"SRID=4326;POINT({run['longitude']} {run['latitude']})"
+    collection_date = datetime.fromtimestamp(run['start']).date()
+    return (f"{run['truck_id']},{wkt_point},{run['start']},{run['speed']},{run['is_valid']},"
+            f"{collection_date},{run['route_id']},{run['end'] - run['start']},{run['pings']}\n")
+
+def prepare_temp_files_for_copy(input_file, output_file, worker_id, summary_file, stats_file, track_file=None, reduction=NO_REDUCTION):
+    """Process input file to create COPY-compatible point, route summary and route stats files with transformed data
+
+    output_file may be None to skip the per-point file, track_file None to skip the compact tracks file.
+    reduction controls which pings are written to the point file:
+        dedupe: drop repeated (truck, timestamp) pings, also from summaries, stats and tracks
+        invalid: 'flag' keeps invalid pings with is_valid false, 'drop' leaves them out
+        stationary_radius: when set, consecutive pings of a route with the same validity within
+                           this many meters of the first are written as that one ping with the
+                           run's dwell_seconds and ping_count
+    Route summaries, stats and tracks are computed from every (deduplicated) ping.
+    Returns the number of points read and the number of pings removed by each rule.
+    """
     # Dictionary to keep track of last timestamp for each truck
     last_timestamps = {}
-    # Dictionary to keep track of current route ID for each truck
-    current_route_ids = {}
+    # Dictionary to keep track of the points of the current route for each truck
+    open_routes = {}
     # Global route counter for this worker
     route_counter = worker_id * 1000000  # Ensure unique route IDs across workers
+    points = 0
+    reductions = {'duplicates': 0, 'invalid': 0, 'stationary': 0}
+    # Stationary run being collapsed for each truck, written once the truck moves
+    stationary_runs = {}
+    stationary_radius = reduction['stationary_radius']
     
-    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
+    with open(input_file, 'r') as infile, \
+         open(output_file or os.devnull, 'w') as outfile, \
+         open(summary_file, 'w') as summaryfile, \
+         open(stats_file, 'w') as statsfile, \
+         open(track_file or os.devnull, 'w') as trackfile:
         for i, line in enumerate(infile):
             try:
                 parts = line.strip().split(';')
@@ -151,6 +329,9 @@ def prepare_temp_files_for_copy(input_file, output_file, worker_id):
                     timestamp = int(parts[3])
                     speed = parts[4]
                     is_valid = parts[5] == '1'
+                    lat_value = float(latitude)
+                    lon_value = float(longitude)
+                    speed_value = float(speed) if speed else math.nan
                     
                     # Check if we need to start a new route for this truck
                     new_route = False
@@ -162,23 +343,55 @@ def prepare_temp_files_for_copy(input_file, output_file, worker_id):
                         if time_gap > 86400:
                             new_route = True
                     
-                    # Assign or increment route ID
+                    # Assign or increment route ID, the truck's previous route is complete
                     if new_route:
+                        if truck_id in open_routes:
+                            write_route(open_routes[truck_id], summaryfile, statsfile, trackfile, track_file is not None)
                         route_counter += 1
-                        current_route_ids[truck_id] = route_counter
+                        open_routes[truck_id] = new_route_buffer(route_counter, truck_id)
                     
                     # Update last timestamp for this truck
                     last_timestamps[truck_id] = timestamp
                     
-                    # Get current route ID for this truck
-                    route_id = current_route_ids.get(truck_id, route_counter)
+                    # Get current route for this truck
+                    route = open_routes[truck_id]
+                    route_id = route['route_id']
                     
-                    # Create a tab-separated line ready for COPY
-                    # Format: truck_id, WKT point, timestamp, speed, is_valid, collection_date, route_id
-                    wkt_point = f"SRID=4326;POINT({longitude} {latitude})"
-                    collection_date = datetime.fromtimestamp(timestamp).date()
+                    if reduction['dedupe']:
+                        if timestamp in route['seen']:
+                            reductions['duplicates'] += 1
+                            continue
+                        route['seen'].add(timestamp)
                     
-                    outfile.write(f"{truck_id},{wkt_point},{timestamp},{speed},{is_valid},{collection_date},{route_id}\n")
+                    # Create a line ready for COPY
+                    if output_file:
+                        point = {'truck_id': truck_id, 'latitude': latitude, 'longitude': longitude, 'start': timestamp,
+                                 'end': timestamp, 'speed': speed, 'is_valid': is_valid, 'route_id': route_id,
+                                 'pings': 1}
+                        run = stationary_runs.get(truck_id)
+                        if not is_valid and reduction['invalid'] == 'drop':
+                            reductions['invalid'] += 1
+                        elif stationary_radius is None:
+                            outfile.write(point_copy_line(point))
+                        elif run and run['route_id'] == route_id and run['is_valid'] == is_valid and \
+                                same_position(run, lat_value, lon_value, stationary_radius):
+                            # A change of validity ends the run, so a GPS glitch doesn't absorb valid pings
+                            run['end'] = timestamp
+                            run['pings'] += 1
+                            reductions['stationary'] += 1
+                        else:
+                            if run:
+                                outfile.write(point_copy_line(run))
+                            point['latitude'], point['longitude'] = lat_value, lon_value
+                            stationary_runs[truck_id] = point
+
+                    route['timestamps'].append(timestamp)
+                    route['latitudes'].append(lat_value)
+                    route['longitudes'].append(lon_value)
+                    route['speeds'].append(speed_value)
+                    route['valid'].append(is_valid)
+                    points += 1
+
                     if i % 100000 == 0 and worker_id == 1:
                         print(f"Processed {i} lines...")
 
@@ -186,66 +399,128 @@ def prepare_temp_files_for_copy(input_file, output_file, worker_id):
                 print(f"Error processing line: {line.strip()}, Error: {str(e)}")
                 continue
 
-def load_chunk(chunk_file, conn_params, worker_id, month):
-    """Load a single chunk of data using PostgreSQL's COPY command"""
+        # Routes and stationary runs still open at the end of the chunk are complete as well
+        for route in open_routes.values():
+            write_route(route, summaryfile, statsfile, trackfile, track_file is not None)
+        for run in stationary_runs.values():
+            outfile.write(point_copy_line(run))
+    
+    return points, reductions
+
+def run_copy(copy_command, conn_params):
+    """Run a \\COPY command through psql and return the number of rows copied, or None on failure"""
+    # Execute the COPY command using psql
+    cmd = [
+        r"psql",  # Assuming psql is available in the Docker container's PATH
+        "-h", conn_params['host'],
+        "-p", str(conn_params['port']),
+        "-d", conn_params['dbname'],
+        "-U", conn_params['user'],
+        "-c", copy_command
+    ]
+    
+    # Set PGPASSWORD environment variable for passwordless connection
+    env = os.environ.copy()
+    env["PGPASSWORD"] = conn_params['password']
+    
+    result = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    
+    if result.returncode != 0:
+        print(f"COPY error: {result.stderr}")
+        return None
+    
+    # Extract number of rows copied
+    output = result.stdout
+    rows_copied = 0
+    for line in output.split('\n'):
+        if "COPY" in line:
+            parts = line.split()
+            if len(parts) >= 2:
+                try:
+                    rows_copied = int(parts[1])
+                except ValueError:
+                    pass
+    
+    return rows_copied
+
+def load_chunk(chunk_file, conn_params, worker_id, month, layout='points', reduction=NO_REDUCTION):
+    """Load a single chunk of data using PostgreSQL's COPY command
+
+    Returns the number of points loaded, the number of pings removed by each reduction rule
+    and the tables whose COPY failed. A chunk with any failed table isn't fully loaded.
+    """
+    processed_file = f"{chunk_file}.processed" if layout != 'compact' else None
+    summary_file = f"{chunk_file}.summary"
+    stats_file = f"{chunk_file}.stats"
+    track_file = f"{chunk_file}.tracks" if layout != 'points' else None
+    failed = []
     try:
         # Process chunk file into a COPY-compatible format
-        processed_file = f"{chunk_file}.processed"
-        prepare_temp_files_for_copy(chunk_file, processed_file, worker_id)
-        
-        # Use psql command for fastest loading
-        copy_command = f"""\\COPY month_{month:02d}_routes (truck_id, location, timestamp, speed, is_valid, collection_date, route_id) 
-                           FROM '{processed_file}' WITH (FORMAT csv, DELIMITER E',', QUOTE '"', ESCAPE '\\', NULL '\\N')"""
-        
-        # Execute the COPY command using psql
-        cmd = [
-            r"psql",  # Assuming psql is available in the Docker container's PATH
-            "-h", conn_params['host'],
-            "-p", str(conn_params['port']),
-            "-d", conn_params['dbname'],
-            "-U", conn_params['user'],
-            "-c", copy_command
-        ]
-        
-        # Set PGPASSWORD environment variable for passwordless connection
-        env = os.environ.copy()
-        env["PGPASSWORD"] = conn_params['password']
+        points, reductions = prepare_temp_files_for_copy(chunk_file, processed_file, worker_id, summary_file, stats_file, track_file, reduction)
         
-        # Execute command
         start_time = time.time()
-        print(f"running COPY command for Worker {worker_id}")
-        result = subprocess.run(cmd, env=env, capture_output=True, text=True)
-        print(f"DONE running COPY command for Worker {worker_id}")
-        
-        if result.returncode != 0:
-            print(f"Worker {worker_id} error: {result.stderr}")
-            return 0
+        # Points are loaded as rows, or as part of a track in the compact layout
+        rows_copied = points
+        if processed_file:
+            # Use psql command for fastest loading
+            copy_command = f"""\\COPY month_{month:02d}_routes (truck_id, location, timestamp, speed, is_valid, collection_date, route_id, dwell_seconds, ping_count) 
+                               FROM '{processed_file}' WITH (FORMAT csv, DELIMITER E',', QUOTE '"', ESCAPE '\\', NULL '\\N')"""
+            
+            # Execute command
+            print(f"running COPY command for Worker {worker_id}")
+            rows_copied = run_copy(copy_command, conn_params)
+            print(f"DONE running COPY command for Worker {worker_id}")
+            
+            if rows_copied is None:
+                print(f"Worker {worker_id} failed to load points")
+                return 0, reductions, [f"month_{month:02d}_routes"]
         
-        # Extract number of rows copied
-        output = result.stdout
-        rows_copied = 0
-        for line in output.split('\n'):
-            if "COPY" in line:
-                parts = line.split()
-                if len(parts) >= 2:
-                    try:
-                        rows_copied = int(parts[1])
-                    except ValueError:
-                        pass
+        if track_file:
+            track_command = f"""\\COPY month_{month:02d}_route_tracks (route_id, truck_id, start_time, point_count, time_deltas, lat_deltas, lon_deltas, speeds, invalid_offsets) 
+                                FROM '{track_file}' WITH (FORMAT csv, DELIMITER E',', QUOTE '"', ESCAPE '\\', NULL '\\N')"""
+            tracks_copied = run_copy(track_command, conn_params)
+            if tracks_copied is None:
+                # Summaries and stats don't depend on the tracks, so they're still loaded
+                print(f"Worker {worker_id} failed to load route tracks")
+                failed.append(f"month_{month:02d}_route_tracks")
+            else:
+                print(f"Worker {worker_id}: Loaded {tracks_copied} compact route tracks")
         
         elapsed = time.time() - start_time
         rate = rows_copied / elapsed if elapsed > 0 else 0
         print(f"Worker {worker_id}: Loaded {rows_copied} rows in {elapsed:.2f}s ({rate:.2f} rows/sec)")
+        if any(reductions.values()):
+            print(f"Worker {worker_id}: Removed pings {reductions}")
         
-        # Clean up temp files
-        os.unlink(processed_file)
-        os.unlink(chunk_file)
+        summary_command = f"""\\COPY month_{month:02d}_route_summary (route_id, truck_id, start_time, end_time, start_point, end_point, bbox, point_count, distance_km, max_speed) 
+                              FROM '{summary_file}' WITH (FORMAT csv, DELIMITER E',', QUOTE '"', ESCAPE '\\', NULL '\\N')"""
+        routes_copied = run_copy(summary_command, conn_params)
+        if routes_copied is None:
+            print(f"Worker {worker_id} failed to load route summaries")
+            failed.append(f"month_{month:02d}_route_summary")
+        else:
+            print(f"Worker {worker_id}: Loaded {routes_copied} route summaries")
         
-        return rows_copied
+        stats_command = f"""\\COPY month_{month:02d}_route_stats (route_id, truck_id, start_time, duration_seconds, distance_km, moving_seconds, idle_seconds, avg_speed, max_speed, avg_moving_speed_kmh, dwell_count, dwell_seconds, longest_dwell_seconds, invalid_ratio) 
+                            FROM '{stats_file}' WITH (FORMAT csv, DELIMITER E',', QUOTE '"', ESCAPE '\\', NULL '\\N')"""
+        stats_copied = run_copy(stats_command, conn_params)
+        if stats_copied is None:
+            print(f"Worker {worker_id} failed to load route stats")
+            failed.append(f"month_{month:02d}_route_stats")
+        else:
+            print(f"Worker {worker_id}: Loaded {stats_copied} route stats")
+        
+        return rows_copied, reductions, failed
     
     except Exception as e:
         print(f"Worker {worker_id} exception: {str(e)}")
-        return 0
+        return 0, {}, [f"month_{month:02d}_routes"]
+    
+    finally:
+        # Clean up temp files, including those of a chunk that failed part way
+        for temp_file in (processed_file, track_file, summary_file, stats_file, chunk_file):
+            if temp_file and os.path.exists(temp_file):
+                os.unlink(temp_file)
 
 def process_route_chunk(chunk_file, conn_params, worker_id, month):
     """Process a chunk of data to create route IDs"""
@@ -342,9 +617,42 @@ def create_indexes(conn_params, month):
             CREATE INDEX idx_location ON month_{month:02d}_routes USING GIST(location);
         END IF;
         
+        -- Viewport queries filter on the lat/lon rectangle, which a geography box doesn't match
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_location_geom_{month:02d}') THEN
+            CREATE INDEX idx_location_geom_{month:02d} ON month_{month:02d}_routes USING GIST((location::geometry));
+        END IF;
+        
         IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_id') THEN
             CREATE INDEX idx_route_id ON month_{month:02d}_routes(route_id);
         END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_summary_start_time_{month:02d}') THEN
+            CREATE INDEX idx_route_summary_start_time_{month:02d} ON month_{month:02d}_route_summary(start_time);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_summary_truck_id_{month:02d}') THEN
+            CREATE INDEX idx_route_summary_truck_id_{month:02d} ON month_{month:02d}_route_summary(truck_id);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_summary_start_point_{month:02d}') THEN
+            CREATE INDEX idx_route_summary_start_point_{month:02d} ON month_{month:02d}_route_summary USING GIST(start_point);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_summary_end_point_{month:02d}') THEN
+            CREATE INDEX idx_route_summary_end_point_{month:02d} ON month_{month:02d}_route_summary USING GIST(end_point);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_summary_bbox_{month:02d}') THEN
+            CREATE INDEX idx_route_summary_bbox_{month:02d} ON month_{month:02d}_route_summary USING GIST(bbox);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_stats_start_time_{month:02d}') THEN
+            CREATE INDEX idx_route_stats_start_time_{month:02d} ON month_{month:02d}_route_stats(start_time);
+        END IF;
+        
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_route_stats_truck_id_{month:02d}') THEN
+            CREATE INDEX idx_route_stats_truck_id_{month:02d} ON month_{month:02d}_route_stats(truck_id);
+        END IF;
     END $$;
     """)
     
@@ -362,12 +670,28 @@ def main():
     parser.add_argument('--password', type=str, required=True, help='Database password')
     parser.add_argument('--workers', type=int, default=0, 
                         help='Number of parallel workers (0=auto based on CPU count)')
+    parser.add_argument('--layout', choices=['points', 'compact', 'both'], default='points',
+                        help='Store one row per point (month_XX_routes), one delta encoded row per route '
+                             '(month_XX_route_tracks), or both. Tile, heatmap and trajectory queries read the point rows.')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='Drop repeated pings of a truck with the same timestamp')
+    parser.add_argument('--invalid', choices=['flag', 'drop'], default='flag',
+                        help='Keep invalid pings with is_valid false, or leave them out of month_XX_routes')
+    parser.add_argument('--collapse-stationary', type=float, metavar='METERS',
+                        help='Write runs of pings within METERS of each other as one point with dwell_seconds '
+                             '(0 collapses identical positions only)')
     
     args = parser.parse_args()
     
     # Determine number of workers
     workers = args.workers if args.workers > 0 else os.cpu_count()
     
+    reduction = {
+        'dedupe': args.dedupe,
+        'invalid': args.invalid,
+        'stationary_radius': args.collapse_stationary
+    }
+    
     # Connection parameters
     conn_params = {
         'host': args.host,
@@ -384,7 +708,7 @@ def main():
         return
     
     # Setup database schema
-    setup_database(conn_params, args.month)
+    setup_database(conn_params, args.month, args.layout)
     
     # Split the file
     print(f"Splitting file into {workers} chunks...")
@@ -394,18 +718,24 @@ def main():
     print(f"Starting parallel load with {workers} workers...")
     start_time = time.time()
     total_rows = 0
+    total_reductions = {}
+    failed_chunks = []
     
     with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
         # Submit all loading tasks
         futures = []
         for i, chunk_file in enumerate(chunk_files):
-            future = executor.submit(load_chunk, chunk_file, conn_params, i+1, args.month)
+            future = executor.submit(load_chunk, chunk_file, conn_params, i+1, args.month, args.layout, reduction)
             futures.append(future)
         
         # Process results as they complete
         for future in concurrent.futures.as_completed(futures):
-            rows = future.result()
+            rows, reductions, failed = future.result()
             total_rows += rows
+            if failed:
+                failed_chunks.append(failed)
+            for rule, count in reductions.items():
+                total_reductions[rule] = total_reductions.get(rule, 0) + count
     
     total_time = time.time() - start_time
     avg_rate = total_rows / total_time if total_time > 0 else 0
@@ -414,9 +744,23 @@ def main():
     print(f"Total rows: {total_rows:,}")
     print(f"Total time: {total_time:.2f} seconds")
     print(f"Average rate: {avg_rate:.2f} rows/second")
+    for rule, count in total_reductions.items():
+        print(f"Pings removed ({rule}): {count:,}")
     
     # Create indexes after data is loaded
     create_indexes(conn_params, args.month)
+    
+    # Record which regions each route starts and ends in
+    assign_route_regions(conn_params, args.month)
+    
+    # Cached vector tiles of this month are stale now
+    invalidate_tile_cache(args.month)
+    
+    # Route summaries and stats feed other queries, a partial load must not look like a success
+    if failed_chunks:
+        tables = sorted({table for failed in failed_chunks for table in failed})
+        print(f"\nError: {len(failed_chunks)} of {len(chunk_files)} chunks failed to load {', '.join(tables)}")
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,6 +7,7 @@ import subprocess
 import argparse
 import tempfile
 import math
+from tile_cache import invalidate_tile_cache
 
 def split_file_into_chunks(file_path, num_chunks):
     """Split a large file into roughly equal chunks and return temp file paths"""
@@ -175,6 +176,11 @@ def create_indexes(conn_params, month):
         IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_location_{month:02d}') THEN
             CREATE INDEX idx_location_{month:02d} ON month_{month:02d}_stops USING GIST(location);
         END IF;
+        
+        -- Vector tiles filter on the tile's lat/lon envelope, which a geography box doesn't match
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_stop_location_geom_{month:02d}') THEN
+            CREATE INDEX idx_stop_location_geom_{month:02d} ON month_{month:02d}_stops USING GIST((location::geometry));
+        END IF;
     END $$;
     """)
     
@@ -238,6 +244,9 @@ def main():
     print(f"Average rate: {avg_rate:.2f} rows/second")
     
     create_indexes(conn_params, args.month)
+    
+    # Cached vector tiles of this month are stale now
+    invalidate_tile_cache(args.month)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,198 @@
+from datetime import timedelta
+import math
+import time
+import psycopg2
+import concurrent.futures
+import argparse
+import os
+
+# eps values (radians, haversine metric) that the heatmap endpoint is expected to be called with
+DEFAULT_EPS = [0.0001, 0.0005, 0.001]
+
+# eps is stored as NUMERIC rounded to this many decimal places, the heatmap
+# endpoint rounds the requested eps the same way (EPS_DIGITS in queries.ts)
+EPS_DIGITS = 8
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def bin_size_for_eps(eps):
+    """Grid cell size in degrees used to summarize stops for a given eps.
+    Matches the default cell size of the 'binned' heatmap mode."""
+    return math.degrees(eps) / 4
+
+def setup_database(conn_params):
+    """Create the daily summary table if it does not exist"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    # One row per (eps, day, grid cell). Cells from different days can be merged
+    # by summing counts and weighting the centroids by count.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS heatmap_daily_bins (
+        eps NUMERIC NOT NULL,
+        day DATE NOT NULL,
+        cell_x INTEGER NOT NULL,
+        cell_y INTEGER NOT NULL,
+        latitude DOUBLE PRECISION NOT NULL,
+        longitude DOUBLE PRECISION NOT NULL,
+        stop_count INTEGER NOT NULL,
+        duration_sum BIGINT NOT NULL,
+        PRIMARY KEY (eps, day, cell_x, cell_y)
+    );
+    """)
+
+    # Tables created with a DOUBLE PRECISION eps are converted in place
+    cursor.execute(f"""
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'heatmap_daily_bins' AND column_name = 'eps' AND data_type = 'double precision'
+        ) THEN
+            ALTER TABLE heatmap_daily_bins ALTER COLUMN eps TYPE NUMERIC USING ROUND(eps::numeric, {EPS_DIGITS});
+        END IF;
+    END $$;
+    """)
+
+    cursor.close()
+    conn.close()
+
+    print("Summary table ready.")
+
+def get_month_days(conn_params, month):
+    """Return the distinct days that have stops in the month table"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT MIN(start_time)::date, MAX(start_time)::date
+    FROM month_{month:02d}_stops;
+    """)
+    first_day, last_day = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if first_day is None:
+        return []
+    return [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+def get_materialized_days(conn_params, eps, days):
+    """Return the days among days that already have summaries for eps"""
+    if not days:
+        return set()
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT DISTINCT day FROM heatmap_daily_bins
+    WHERE eps = ROUND(%s::numeric, {EPS_DIGITS}) AND day BETWEEN %s AND %s;
+    """, (eps, min(days), max(days)))
+    days = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    conn.close()
+    return days
+
+def materialize_day(conn_params, month, day, eps_values, rebuild):
+    """Summarize one day of stops into grid cells for each eps"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    start_time = time.time()
+    rows = 0
+
+    for eps in eps_values:
+        if rebuild:
+            cursor.execute(f"DELETE FROM heatmap_daily_bins WHERE eps = ROUND(%s::numeric, {EPS_DIGITS}) AND day = %s;", (eps, day))
+
+        bin_size = bin_size_for_eps(eps)
+        # The range predicate on start_time lets each day use idx_start_time_XX
+        cursor.execute(f"""
+        INSERT INTO heatmap_daily_bins (eps, day, cell_x, cell_y, latitude, longitude, stop_count, duration_sum)
+        SELECT
+            ROUND(%(eps)s::numeric, {EPS_DIGITS}),
+            %(day)s,
+            FLOOR(ST_X(location::geometry) / %(bin_size)s)::int AS cell_x,
+            FLOOR(ST_Y(location::geometry) / %(bin_size)s)::int AS cell_y,
+            AVG(ST_Y(location::geometry)),
+            AVG(ST_X(location::geometry)),
+            COUNT(*),
+            SUM(duration_minutes)
+        FROM month_{month:02d}_stops
+        WHERE start_time >= %(day)s
+        AND start_time < %(next_day)s
+        GROUP BY cell_x, cell_y;
+        """, {'eps': eps, 'day': day, 'next_day': day + timedelta(days=1), 'bin_size': bin_size})
+        rows += cursor.rowcount
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"{day}: stored {rows} cells in {elapsed:.2f}s")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute daily heatmap summaries from loaded stop data')
+    parser.add_argument('--month', type=int, required=True, help='Month number (1-12)')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+    parser.add_argument('--eps', type=float, nargs='+', default=DEFAULT_EPS,
+                        help='eps values to precompute summaries for')
+    parser.add_argument('--rebuild', '--force', action='store_true',
+                        help='Recompute days of the month that already have summaries, e.g. after loading more stops')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of parallel workers (0=auto based on CPU count)')
+
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    setup_database(conn_params)
+
+    days = get_month_days(conn_params, args.month)
+
+    # Stops for past days never change, so only days of this month missing a
+    # summary for some eps need work unless a rebuild is requested
+    tasks = {}
+    for eps in args.eps:
+        done = set() if args.rebuild else get_materialized_days(conn_params, eps, days)
+        for day in days:
+            if day not in done:
+                tasks.setdefault(day, []).append(eps)
+
+    if not tasks:
+        print("All days are already summarized.")
+        return
+
+    print(f"Summarizing {len(tasks)} days with {workers} workers...")
+    start_time = time.time()
+    total_rows = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(materialize_day, conn_params, args.month, day, eps_values, args.rebuild)
+            for day, eps_values in sorted(tasks.items())
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            total_rows += future.result()
+
+    total_time = time.time() - start_time
+    print(f"\nSummaries complete!")
+    print(f"Total cells: {total_rows:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import time
+import psycopg2
+import concurrent.futures
+import argparse
+import os
+from tile_cache import invalidate_tile_cache
+
+# Douglas-Peucker tolerances in degrees, roughly 11m, 110m and 1.1km
+DEFAULT_TOLERANCES = [0.0001, 0.001, 0.01]
+
+def get_connection(conn_params):
+    conn_string = f"host={conn_params['host']} port={conn_params['port']} dbname={conn_params['dbname']} user={conn_params['user']} password={conn_params['password']}"
+    return psycopg2.connect(conn_string)
+
+def setup_database(conn_params, month):
+    """Create the simplified route table if it does not exist"""
+    conn = get_connection(conn_params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    # The M coordinate of every vertex is the point's timestamp. The primary key
+    # leads with tolerance so picking a level and its routes is an index scan.
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS month_{month:02d}_route_shapes (
+        tolerance DOUBLE PRECISION NOT NULL,
+        route_id INT NOT NULL,
+        geom GEOMETRY(LINESTRINGM, 4326) NOT NULL,
+        point_count INT NOT NULL,
+        PRIMARY KEY (tolerance, route_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_route_shapes_geom_{month:02d} ON month_{month:02d}_route_shapes USING GIST(geom);
+    """)
+
+    cursor.close()
+    conn.close()
+
+    print("Route shape table ready.")
+
+def get_route_id_ranges(conn_params, month, num_ranges):
+    """Split the month's route ids into contiguous ranges of roughly equal route count"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT route_id FROM month_{month:02d}_route_summary ORDER BY route_id;")
+    route_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+
+    if not route_ids:
+        return []
+
+    size = -(-len(route_ids) // num_ranges)
+    return [(route_ids[i], route_ids[min(i + size, len(route_ids)) - 1]) for i in range(0, len(route_ids), size)]
+
+def simplify_route_range(conn_params, month, first_route_id, last_route_id, tolerances, worker_id):
+    """Build the simplified geometries of a range of routes at every tolerance"""
+    conn = get_connection(conn_params)
+    cursor = conn.cursor()
+    start_time = time.time()
+
+    cursor.execute(f"""
+    DELETE FROM month_{month:02d}_route_shapes
+    WHERE route_id BETWEEN %(first)s AND %(last)s;
+
+    INSERT INTO month_{month:02d}_route_shapes (tolerance, route_id, geom, point_count)
+    SELECT t.tolerance, r.route_id, s.geom, CASE WHEN r.points > 1 THEN ST_NPoints(s.geom) ELSE 1 END
+    FROM (
+        SELECT
+            route_id,
+            COUNT(*) AS points,
+            -- A single point route is stored as a line from the point to itself with a
+            -- point_count of 1, so zoomed responses still include it
+            ST_SetSRID(CASE WHEN COUNT(*) > 1
+                THEN ST_MakeLine(point ORDER BY timestamp)
+                ELSE ST_MakeLine((ARRAY_AGG(point))[1], (ARRAY_AGG(point))[1])
+            END, 4326) AS line
+        FROM (
+            SELECT route_id, timestamp, ST_MakePointM(ST_X(location::geometry), ST_Y(location::geometry), timestamp) AS point
+            FROM month_{month:02d}_routes
+            WHERE route_id BETWEEN %(first)s AND %(last)s
+        ) points
+        GROUP BY route_id
+    ) r
+    CROSS JOIN UNNEST(%(tolerances)s::double precision[]) AS t(tolerance)
+    -- preserveCollapsed keeps very short routes from disappearing at coarse tolerances
+    CROSS JOIN LATERAL (SELECT ST_Simplify(r.line, t.tolerance, true) AS geom) s;
+    """, {'first': first_route_id, 'last': last_route_id, 'tolerances': tolerances})
+    rows = cursor.rowcount
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"Worker {worker_id}: simplified routes {first_route_id}-{last_route_id} ({rows} shapes) in {elapsed:.2f}s")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute simplified route geometries at several tolerances')
+    parser.add_argument('--month', type=int, required=True, help='Month number (1-12)')
+    parser.add_argument('--host', type=str, default='localhost', help='Database host')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--dbname', type=str, default='mydatabase', help='Database name')
+    parser.add_argument('--user', type=str, default='postgres', help='Database user')
+    parser.add_argument('--password', type=str, required=True, help='Database password')
+    parser.add_argument('--tolerances', type=float, nargs='+', default=DEFAULT_TOLERANCES,
+                        help='Simplification tolerances in degrees')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of parallel workers (0=auto based on CPU count)')
+
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+
+    conn_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+
+    setup_database(conn_params, args.month)
+
+    ranges = get_route_id_ranges(conn_params, args.month, workers)
+    print(f"Simplifying routes at tolerances {args.tolerances} with {workers} workers...")
+    start_time = time.time()
+    total_rows = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(simplify_route_range, conn_params, args.month, first, last, args.tolerances, i + 1)
+            for i, (first, last) in enumerate(ranges)
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            total_rows += future.result()
+
+    total_time = time.time() - start_time
+    print(f"\nSimplification complete!")
+    print(f"Total shapes: {total_rows:,}")
+    print(f"Total time: {total_time:.2f} seconds")
+
+    # The routes tile layer is drawn from these shapes
+    invalidate_tile_cache(args.month)
+
+if __name__ == "__main__":
+    main()
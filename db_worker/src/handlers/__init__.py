@@ -1,4 +1,35 @@
-from .regular_handler import RegularQueryHandler
-from .heatmap_handler import HeatmapHandler
+import importlib
 
-__all__ = ['RegularQueryHandler', 'HeatmapHandler'] 
\ No newline at end of file
+# Job type -> (module, handler class). Handler modules are only imported when a
+# handler of their type is created, so a worker serving SQL-only job types never
+# imports pandas, scikit-learn or redis.
+HANDLERS = {
+    'regular': ('.regular_handler', 'RegularQueryHandler'),
+    'heatmap': ('.heatmap_handler', 'HeatmapHandler'),
+    'heatmap_tiles': ('.heatmap_tile_handler', 'HeatmapTileHandler'),
+    'viewport': ('.viewport_handler', 'ViewportHandler'),
+    'mvt': ('.mvt_handler', 'MVTHandler'),
+    'fanout': ('.fanout_handler', 'FanOutHandler'),
+    'trip_stats': ('.trip_stats_handler', 'TripStatsHandler'),
+    'prediction': ('.prediction_handler', 'PredictionHandler')
+}
+
+def handler_class(job_type: str):
+    """Import and return the handler class of a job type"""
+    if job_type not in HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    module, name = HANDLERS[job_type]
+    return getattr(importlib.import_module(module, __name__), name)
+
+def create_handler(job_type: str):
+    return handler_class(job_type)()
+
+# `from handlers import HeatmapHandler` keeps working, importing the module on first access
+_CLASSES = {name: job_type for job_type, (_, name) in HANDLERS.items()}
+
+def __getattr__(name):
+    if name in _CLASSES:
+        return handler_class(_CLASSES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ['HANDLERS', 'handler_class', 'create_handler'] + list(_CLASSES)
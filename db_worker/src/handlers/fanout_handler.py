@@ -0,0 +1,122 @@
+import os
+import datetime
+import decimal
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+# SQLSTATE of a missing table
+UNDEFINED_TABLE = '42P01'
+
+class FanOutHandler:
+    """Run one logical query against several month tables concurrently and merge the results.
+
+    The query is a template in which every `{month}` is replaced with the zero padded
+    month number, e.g. `FROM month_{month}_route_summary`. params:
+        months: month numbers to run the query for
+        merge:  how to combine the per-month rows, see merge()
+    Months whose tables are not loaded are skipped and listed in skipped_months.
+    """
+
+    def __init__(self):
+        # Each sub-query holds one pooled connection while it runs
+        self.max_workers = int(os.getenv('FANOUT_MAX_WORKERS', 8))
+
+    def process(self, query: str, params: dict):
+        months = params['months']
+        sub_queries = [query.replace('{month}', f"{month:02d}") for month in months]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sub_queries))) as executor:
+            partials = list(executor.map(self.run_sub_query, sub_queries))
+
+        return {
+            'rows': self.merge([partial for partial in partials if partial is not None], params.get('merge', {})),
+            'skipped_months': [month for month, partial in zip(months, partials) if partial is None]
+        }
+
+    def run_sub_query(self, query: str):
+        """Rows of one month, or None when the month's tables are not loaded"""
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execute(text(query))
+                return [self.to_json_row(row._mapping) for row in result]
+        except ProgrammingError as e:
+            if getattr(e.orig, 'pgcode', None) == UNDEFINED_TABLE:
+                return None
+            raise
+
+    def merge(self, partials: list, merge: dict):
+        """Combine per-month rows.
+
+        With no groupBy the rows are concatenated in month order. With groupBy, rows sharing
+        the groupBy values are combined: columns in sum/min/max are summed, minimized or
+        maximized, skipping NULLs, and each avg column is re-averaged weighted by the column
+        it maps to (e.g. {"avg_distance_km": "routes"}). Rows are then optionally sorted by
+        orderBy and truncated to limit.
+        """
+        rows = [row for partial in partials for row in partial]
+
+        group_by = merge.get('groupBy')
+        if group_by:
+            sums = merge.get('sum', [])
+            mins = merge.get('min', [])
+            maxes = merge.get('max', [])
+            averages = merge.get('avg', {})
+
+            groups = {}
+            for row in rows:
+                key = tuple(row[column] for column in group_by)
+                merged = groups.get(key)
+                if merged is None:
+                    merged = {column: row[column] for column in group_by}
+                    for column in sums:
+                        merged[column] = 0
+                    for column in mins + maxes:
+                        merged[column] = None
+                    for column in averages:
+                        merged[column] = 0
+                        merged.setdefault(f'__weight_{column}', 0)
+                    groups[key] = merged
+
+                for column in sums:
+                    merged[column] += row[column] or 0
+                # NULLs are ignored like in SQL, a month without values doesn't erase the others
+                for column in mins:
+                    if row[column] is not None:
+                        merged[column] = row[column] if merged[column] is None else min(merged[column], row[column])
+                for column in maxes:
+                    if row[column] is not None:
+                        merged[column] = row[column] if merged[column] is None else max(merged[column], row[column])
+                for column, weight_column in averages.items():
+                    if row[column] is not None:
+                        weight = row[weight_column] or 0
+                        merged[column] += row[column] * weight
+                        merged[f'__weight_{column}'] += weight
+
+            rows = []
+            for merged in groups.values():
+                for column in averages:
+                    weight = merged.pop(f'__weight_{column}')
+                    merged[column] = merged[column] / weight if weight else None
+                rows.append(merged)
+
+        order_by = merge.get('orderBy')
+        if order_by:
+            rows.sort(key=lambda row: tuple(row[column] for column in order_by))
+
+        limit = merge.get('limit')
+        if limit is not None:
+            rows = rows[:limit]
+
+        return rows
+
+    def to_json_row(self, row):
+        processed_row = {}
+        for key, value in row.items():
+            if isinstance(value, decimal.Decimal):
+                processed_row[key] = float(value)
+            elif isinstance(value, (datetime.date, datetime.datetime)):
+                processed_row[key] = value.isoformat()
+            else:
+                processed_row[key] = value
+        return processed_row
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 from sklearn.cluster import DBSCAN
-from collections import Counter
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from .fanout_handler import UNDEFINED_TABLE
 
 class HeatmapHandler:
     def process(self, query: str, params: dict):
@@ -9,56 +11,138 @@ class HeatmapHandler:
         try:
             # Use pandas to read the SQL query directly
             df = pd.read_sql_query(query, self.engine)
+            fallback = {}
+
+            # Summary queries only return rows for days materialized for the eps. The
+            # stops of the other days in the range are binned from the month tables.
+            if params.get('missingDaysQuery'):
+                missing_days = pd.read_sql_query(params['missingDaysQuery'], self.engine)['day'].tolist()
+                if missing_days:
+                    binned, skipped_months = self.read_fallback(params['fallbackQuery'], params['fallbackMonths'], missing_days)
+                    df = pd.concat([df, binned], ignore_index=True) if not df.empty else binned
+                    fallback = {
+                        'mode': 'binned' if len(missing_days) == params['rangeDays'] else 'summary',
+                        'unsummarized_days': [day.isoformat() for day in missing_days],
+                        'skipped_months': skipped_months
+                    }
 
             if df.empty:
                 return {
                     'total_points': 0,
                     'max_intensity': 0,
-                    'heatmap_data': []
+                    'heatmap_data': [],
+                    **fallback
                 }
 
-            # Extract coordinates
-            coordinates = df[['latitude', 'longitude']].values
-
-            # Apply DBSCAN clustering with provided parameters
-            db = DBSCAN(
-                eps=params['eps'],
-                min_samples=params['minSamples'],
-                metric='haversine'
-            ).fit(np.radians(coordinates))
-
-            # Assign cluster labels
-            df['cluster'] = db.labels_
-
-            # Count stops per cluster
-            cluster_counts = Counter(df['cluster'])
-            max_count = max(cluster_counts.values()) if cluster_counts else 0
-
-            # Compute intensity (normalized stop count)
-            heatmap_data = []
-            for cluster, count in cluster_counts.items():
-                if cluster == -1:  # Ignore noise points
-                    continue
-                cluster_points = df[df['cluster'] == cluster]
-                avg_lat = cluster_points['latitude'].mean()
-                avg_lon = cluster_points['longitude'].mean()
-                avg_duration = cluster_points['duration_minutes'].mean()
-                
-                intensity = count / max_count if max_count > 0 else 0
-                heatmap_data.append({
-                    'latitude': float(avg_lat),
-                    'longitude': float(avg_lon),
-                    'intensity': float(intensity),
-                    'count': int(count),
-                    'avg_duration_minutes': float(avg_duration)
-                })
-
-            return {
-                'total_points': len(df),
-                'max_intensity': float(max_count),
-                'heatmap_data': heatmap_data
-            }
+            # Binned queries return one row per grid cell with the number of stops
+            # in it and their summed duration. Raw queries return one row per stop.
+            if 'stop_count' in df.columns:
+                weights = df['stop_count'].to_numpy(dtype=float)
+                durations = df['duration_sum'].to_numpy(dtype=float)
+            else:
+                weights = np.ones(len(df))
+                durations = df['duration_minutes'].to_numpy(dtype=float)
+
+            # Approximate queries return a Bernoulli sample of the stops, so every
+            # sampled stop stands in for 1 / fraction stops
+            sample_fraction = params.get('sampleFraction')
+            if sample_fraction:
+                weights = weights / sample_fraction
+                durations = durations / sample_fraction
+
+            result = self.cluster(df, weights, durations, params)
+
+            if sample_fraction:
+                self.add_sampling_error(result, len(df), sample_fraction)
+            result.update(fallback)
+
+            return result
 
         except Exception as e:
             print(f"Error generating heatmap: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    def read_fallback(self, query: str, months: list, days: list):
+        """Run the binned fallback query on every month table for the given days.
+
+        `{month}` in the query is replaced with the zero padded month number and `:days`
+        is bound to the days. Returns the combined rows and the months whose stop tables
+        are not loaded.
+        """
+        frames = []
+        skipped_months = []
+        for month in months:
+            try:
+                frames.append(pd.read_sql_query(text(query.replace('{month}', f"{month:02d}")), self.engine, params={'days': days}))
+            except ProgrammingError as e:
+                if getattr(e.orig, 'pgcode', None) != UNDEFINED_TABLE:
+                    raise
+                skipped_months.append(month)
+        frames = [frame for frame in frames if not frame.empty]
+        return (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()), skipped_months
+
+    def cluster(self, df: pd.DataFrame, weights: np.ndarray, durations: np.ndarray, params: dict):
+        """Run weighted DBSCAN over the rows of df and summarize each cluster"""
+        # Extract coordinates
+        coordinates = df[['latitude', 'longitude']].to_numpy(dtype=float)
+
+        # Apply DBSCAN clustering with provided parameters. Each row counts
+        # as `weight` stops towards min_samples.
+        db = DBSCAN(
+            eps=params['eps'],
+            min_samples=params['minSamples'],
+            metric='haversine'
+        ).fit(np.radians(coordinates), sample_weight=weights)
+
+        labels = db.labels_
+        clustered = labels != -1  # Ignore noise points
+
+        # Stops per cluster, including the noise "cluster" like the original implementation
+        noise_count = weights[~clustered].sum()
+        cluster_ids = labels[clustered]
+        cluster_weights = weights[clustered]
+        num_clusters = cluster_ids.max() + 1 if cluster_ids.size else 0
+
+        counts = np.bincount(cluster_ids, weights=cluster_weights, minlength=num_clusters)
+        lat_sums = np.bincount(cluster_ids, weights=coordinates[clustered, 0] * cluster_weights, minlength=num_clusters)
+        lon_sums = np.bincount(cluster_ids, weights=coordinates[clustered, 1] * cluster_weights, minlength=num_clusters)
+        duration_sums = np.bincount(cluster_ids, weights=durations[clustered], minlength=num_clusters)
+
+        max_count = max(counts.max() if num_clusters else 0, noise_count)
+
+        # Compute intensity (normalized stop count)
+        heatmap_data = []
+        for cluster in range(num_clusters):
+            count = counts[cluster]
+            if count == 0:
+                continue
+            intensity = count / max_count if max_count > 0 else 0
+            heatmap_data.append({
+                'latitude': float(lat_sums[cluster] / count),
+                'longitude': float(lon_sums[cluster] / count),
+                'intensity': float(intensity),
+                'count': int(round(count)),
+                'avg_duration_minutes': float(duration_sums[cluster] / count)
+            })
+
+        return {
+            'total_points': int(round(weights.sum())),
+            'max_intensity': float(max_count),
+            'heatmap_data': heatmap_data
+        }
+
+    def add_sampling_error(self, result: dict, sampled_points: int, sample_fraction: float):
+        """Annotate scaled-up counts with the standard error of a Bernoulli sample"""
+        # With inclusion probability p, n sampled stops estimate N = n / p stops
+        # with standard error sqrt(n * (1 - p)) / p
+        def stderr(estimate):
+            sampled = estimate * sample_fraction
+            return float(np.sqrt(sampled * (1 - sample_fraction)) / sample_fraction)
+
+        result['sample_fraction'] = sample_fraction
+        result['sampled_points'] = sampled_points
+        result['total_points_stderr'] = stderr(result['total_points'])
+        for cluster in result['heatmap_data']:
+            cluster['count_stderr'] = stderr(cluster['count'])
+            # Relative error shrinks with the number of sampled stops in the cluster
+            cluster['count_relative_error'] = cluster['count_stderr'] / cluster['count'] if cluster['count'] else 0.0
@@ -0,0 +1,34 @@
+import math
+from sqlalchemy import text
+
+# Must match TILE_CELLS in build_heatmap_tiles.py
+TILE_CELLS = 64
+
+class HeatmapTileHandler:
+    def process(self, query: str, params: dict):
+        """Decode precomputed heatmap tiles into [latitude, longitude, count] points"""
+        with self.engine.connect() as conn:
+            result = conn.execute(text(query))
+            heatmap_data = []
+            tiles = 0
+            max_count = 0
+            for row in result:
+                tiles += 1
+                max_count = max(max_count, row.max_count)
+                # Global cell coordinates at this zoom level
+                scale = (2 ** row.z) * TILE_CELLS
+                for cell, count in zip(row.cells, row.counts):
+                    gx = row.x * TILE_CELLS + cell % TILE_CELLS + 0.5
+                    gy = row.y * TILE_CELLS + cell // TILE_CELLS + 0.5
+                    longitude = gx / scale * 360 - 180
+                    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * gy / scale))))
+                    heatmap_data.append([latitude, longitude, count])
+
+            return {
+                # The zoom the tiles were read at, the server clamps requests to the built levels
+                'zoom': params.get('zoom'),
+                'requested_zoom': params.get('requestedZoom', params.get('zoom')),
+                'tiles': tiles,
+                'max_intensity': float(max_count),
+                'heatmap_data': heatmap_data
+            }
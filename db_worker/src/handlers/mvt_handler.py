@@ -0,0 +1,49 @@
+import os
+import json
+import redis
+from sqlalchemy import text
+
+# Servers waiting for a tile are notified here with {cacheKey, error?}.
+# Must match RENDERED_CHANNEL in server/src/services/tileCache.ts
+RENDERED_CHANNEL = 'mvt:rendered'
+
+class MVTHandler:
+    def __init__(self):
+        self.cache = None
+        # Tiles also expire on their own, the cache evicts the least recently used ones when full
+        self.ttl = int(os.getenv('MVT_CACHE_TTL', 7 * 24 * 3600))
+
+    def get_cache(self):
+        if self.cache is None:
+            self.cache = redis.Redis(
+                host=os.getenv('REDIS_HOST', 'localhost'),
+                port=int(os.getenv('REDIS_PORT', 6379))
+            )
+        return self.cache
+
+    def process(self, query: str, params: dict):
+        """Render a Mapbox Vector Tile and store it in the Redis tile cache"""
+        cache_key = params['cacheKey']
+        cache = self.get_cache()
+        try:
+            with self.engine.connect() as conn:
+                tile = conn.execute(text(query)).scalar()
+
+            tile = bytes(tile) if tile is not None else b''
+            # The server reads the tile back from the cache, so the job result stays small
+            cache.set(cache_key, tile, ex=self.ttl)
+        except Exception as e:
+            self.notify(cache, cache_key, str(e))
+            raise
+        self.notify(cache, cache_key)
+
+        return {
+            'cache_key': cache_key,
+            'size': len(tile)
+        }
+
+    def notify(self, cache, cache_key: str, error: str = None):
+        """Release the tile's render lock and wake the requests waiting for it"""
+        # Lock key format is renderLockKey in server/src/services/tileCache.ts
+        cache.delete(f"lock:{cache_key}")
+        cache.publish(RENDERED_CHANNEL, json.dumps({'cacheKey': cache_key, 'error': error}))
@@ -0,0 +1,91 @@
+import os
+from collections import OrderedDict
+from datetime import datetime
+import joblib
+import pandas as pd
+
+class PredictionHandler:
+    """Predict delivery times with the model trained by delivery_model.py
+
+    params:
+        trips: list of {originRegionId, destinationRegionId, departure, distanceKm?}.
+               Without a distance the corridor's median route distance is used.
+    """
+
+    def __init__(self):
+        self.model_path = os.getenv('DELIVERY_MODEL_PATH', os.path.join('models', 'delivery_model.joblib'))
+        self.cache_size = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+        self.artifact = None
+        self.model_mtime = None
+        self.cache = OrderedDict()
+
+    def get_artifact(self):
+        """Load the model once per process, and again only when the file is replaced by retraining"""
+        try:
+            mtime = os.path.getmtime(self.model_path)
+        except OSError:
+            raise ValueError(f"No delivery model at {self.model_path}, run delivery_model.py --train first")
+
+        if self.artifact is None or mtime != self.model_mtime:
+            self.artifact = joblib.load(self.model_path)
+            self.model_mtime = mtime
+            # Predictions of the previous model are stale
+            self.cache.clear()
+            print(f"Loaded delivery model trained at {self.artifact['trained_at']}")
+        return self.artifact
+
+    def features(self, trip: dict, artifact: dict):
+        """Model input for one trip, as a hashable tuple in the training column order"""
+        corridor = (trip['originRegionId'], trip['destinationRegionId'])
+        departure = datetime.fromisoformat(trip['departure'].replace('Z', '+00:00'))
+        distance = trip.get('distanceKm')
+        if distance is None:
+            distance = artifact['corridor_distances'].get(corridor, artifact['default_distance_km'])
+
+        key = (
+            corridor[0],
+            corridor[1],
+            # Rounded so nearby requests share cache entries
+            round(float(distance), 1),
+            departure.hour,
+            departure.isoweekday(),
+            artifact['corridor_speeds'].get(corridor, artifact['default_speed_kmh'])
+        )
+        # Models trained before stop features were added don't take the corridor stop time
+        if 'corridor_stop_minutes' in artifact['model'].feature_names_in_:
+            key += (artifact['corridor_stop_minutes'].get(corridor, artifact['default_stop_minutes']),)
+        return key
+
+    def process(self, query: str, params: dict):
+        artifact = self.get_artifact()
+        model = artifact['model']
+        keys = [self.features(trip, artifact) for trip in params['trips']]
+        # Trips served from predictions of earlier requests, not repeats within this one
+        cached = sum(key in self.cache for key in keys)
+
+        # Everything not cached is predicted in a single batch
+        missing = list(dict.fromkeys(key for key in keys if key not in self.cache))
+        if missing:
+            columns = list(model.feature_names_in_)
+            predictions = model.predict(pd.DataFrame(missing, columns=columns))
+            for key, hours in zip(missing, predictions):
+                self.cache[key] = max(float(hours), 0.0)
+
+        results = []
+        for key in keys:
+            self.cache.move_to_end(key)
+            results.append({
+                'duration_hours': self.cache[key],
+                'distance_km': key[2],
+                'corridor_speed_kmh': key[5]
+            })
+
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return {
+            'model_trained_at': artifact['trained_at'],
+            'holdout_mae_hours': artifact['holdout_mae_hours'],
+            'cached': cached,
+            'predictions': results
+        }
@@ -0,0 +1,58 @@
+import pandas as pd
+import numpy as np
+
+# Columns of month_XX_route_stats that are summarized over all selected routes
+METRICS = [
+    'duration_seconds', 'distance_km', 'moving_seconds', 'idle_seconds', 'avg_speed', 'max_speed',
+    'avg_moving_speed_kmh', 'dwell_count', 'dwell_seconds', 'longest_dwell_seconds', 'invalid_ratio'
+]
+
+class TripStatsHandler:
+    def process(self, query: str, params: dict):
+        """Summarize the per-route statistics computed by the route loader"""
+        try:
+            df = pd.read_sql_query(query, self.engine)
+
+            if df.empty:
+                return {
+                    'route_count': 0,
+                    'totals': {},
+                    'metrics': {},
+                    'routes': []
+                }
+
+            metrics = {}
+            for column in METRICS:
+                values = df[column].dropna().to_numpy(dtype=float)
+                if values.size == 0:
+                    metrics[column] = None
+                    continue
+                p50, p90 = np.percentile(values, [50, 90])
+                metrics[column] = {
+                    'mean': float(values.mean()),
+                    'p50': float(p50),
+                    'p90': float(p90),
+                    'max': float(values.max())
+                }
+
+            totals = {
+                'distance_km': float(df['distance_km'].sum()),
+                'moving_seconds': int(df['moving_seconds'].sum()),
+                'idle_seconds': int(df['idle_seconds'].sum()),
+                'dwell_count': int(df['dwell_count'].sum())
+            }
+
+            # Rows come ordered by the query, only the first routeLimit are returned individually
+            routes = df.head(params.get('routeLimit', 100))
+            routes = routes.astype(object).where(routes.notna(), None).to_dict(orient='records')
+
+            return {
+                'route_count': len(df),
+                'totals': totals,
+                'metrics': metrics,
+                'routes': routes
+            }
+
+        except Exception as e:
+            print(f"Error computing trip statistics: {str(e)}")
+            raise
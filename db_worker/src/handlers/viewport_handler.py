@@ -0,0 +1,24 @@
+from sqlalchemy import text
+
+class ViewportHandler:
+    def process(self, query: str, params: dict):
+        """Return grid-aggregated point counts as parallel arrays of cell centers and counts"""
+        cell_size = params['cellSize']
+        latitudes = []
+        longitudes = []
+        counts = []
+        with self.engine.connect() as conn:
+            result = conn.execute(text(query))
+            for row in result:
+                # The query returns integer cell indices, a cell spans cell_size degrees
+                longitudes.append(round((row.cell_x + 0.5) * cell_size, 6))
+                latitudes.append(round((row.cell_y + 0.5) * cell_size, 6))
+                counts.append(int(row.count))
+
+        return {
+            'cell_size': cell_size,
+            'total_points': sum(counts),
+            'latitude': latitudes,
+            'longitude': longitudes,
+            'count': counts
+        }
@@ -1,12 +1,28 @@
+import time
+STARTED = time.perf_counter()
+
 import json
 import os
+import resource
+import sys
 import pika
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
-from handlers import RegularQueryHandler, HeatmapHandler
+from handlers import HANDLERS, create_handler
 
 load_dotenv()
 
+def startup_report(job_types):
+    """Time since the process started and its peak resident memory"""
+    # ru_maxrss is in kilobytes on Linux
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return f"{', '.join(job_types)} in {time.perf_counter() - STARTED:.2f}s, peak RSS {rss_mb:.0f} MB"
+
+def served_job_types():
+    """Job types from WORKER_JOB_TYPES (comma separated), all types when unset"""
+    job_types = os.getenv('WORKER_JOB_TYPES')
+    return [t.strip() for t in job_types.split(',') if t.strip()] if job_types else list(HANDLERS)
+
 class QueryWorker:
     def __init__(self):
         self.connection = None
@@ -14,11 +30,12 @@ class QueryWorker:
         self.engine = create_engine(os.getenv('DATABASE_URL'))
         self.queue_name = 'query_queue'
         
+        # Job types this worker serves, e.g. WORKER_JOB_TYPES=regular,fanout for a
+        # lightweight SQL worker. Only the handler modules of these types are imported.
+        self.job_types = served_job_types()
+        
         # Initialize handlers with engine
-        self.handlers = {
-            'regular': RegularQueryHandler(),
-            'heatmap': HeatmapHandler()
-        }
+        self.handlers = {job_type: create_handler(job_type) for job_type in self.job_types}
         
         # Set engine for each handler
         for handler in self.handlers.values():
@@ -32,9 +49,19 @@ class QueryWorker:
                 pika.ConnectionParameters(host=os.getenv('RABBITMQ_HOST', 'localhost'))
             )
             self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=self.queue_name, durable=True)
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(queue=self.queue_name, on_message_callback=self.process_query)
+            # One unacked job for the whole channel, not per consumer. Otherwise the
+            # worker holds a job of every type it serves while running one of them,
+            # and those jobs wait instead of going to an idle worker.
+            self.channel.basic_qos(prefetch_count=1, global_qos=True)
+            
+            # Every job type has its own queue so workers can serve a subset of them
+            queues = [f"{self.queue_name}.{job_type}" for job_type in self.job_types]
+            # Jobs submitted before the queues were split, only drained by workers serving every type
+            if set(self.job_types) == set(HANDLERS):
+                queues.append(self.queue_name)
+            for queue in queues:
+                self.channel.queue_declare(queue=queue, durable=True)
+                self.channel.basic_consume(queue=queue, on_message_callback=self.process_query)
         except Exception as e:
             print(f"Failed to connect to RabbitMQ: {e}")
             raise
@@ -70,7 +97,7 @@ class QueryWorker:
             # Get the appropriate handler
             handler = self.handlers.get(job_type)
             if not handler:
-                raise ValueError(f"Unknown job type: {job_type}")
+                raise ValueError(f"Unknown job type for this worker: {job_type}")
 
             # Execute the handler
             result = handler.process(query, params)
@@ -84,12 +111,19 @@ class QueryWorker:
             ch.basic_ack(delivery_tag=method.delivery_tag)
 
     def run(self):
-        print("Worker started. Waiting for messages...")
+        print(f"Worker started for {startup_report(self.job_types)}. Waiting for messages...")
         try:
             self.channel.start_consuming()
         except KeyboardInterrupt:
             self.connection.close()
 
 if __name__ == '__main__':
-    worker = QueryWorker()
-    worker.run() 
\ No newline at end of file
+    if '--startup-report' in sys.argv:
+        # Load the handlers without connecting anywhere, to compare worker configurations
+        job_types = served_job_types()
+        for job_type in job_types:
+            create_handler(job_type)
+        print(f"Handlers loaded for {startup_report(job_types)}")
+    else:
+        worker = QueryWorker()
+        worker.run() 
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_route_data_into_db_parallel import NO_REDUCTION, prepare_temp_files_for_copy
+
+def load(tmp_path, pings, **reduction):
+    """Run the transform over (truck, lat, lon, timestamp, speed, valid) pings, returning point rows and reductions"""
+    raw = tmp_path / 'raw.csv'
+    raw.write_text(''.join(f"{t};{lat};{lon};{ts};{speed};{valid}\n" for t, lat, lon, ts, speed, valid in pings))
+    points = tmp_path / 'points.csv'
+    _, reductions = prepare_temp_files_for_copy(str(raw), str(points), 1, str(tmp_path / 'summary.csv'),
+                                                str(tmp_path / 'stats.csv'), reduction=dict(NO_REDUCTION, **reduction))
+
+    rows = []
+    for line in points.read_text().splitlines():
+        truck_id, _, timestamp, _, is_valid, _, route_id, dwell_seconds, ping_count = line.split(',')
+        rows.append({'truck_id': truck_id, 'timestamp': int(timestamp), 'is_valid': is_valid == 'True',
+                     'route_id': int(route_id), 'dwell_seconds': int(dwell_seconds), 'ping_count': int(ping_count)})
+    return sorted(rows, key=lambda row: row['timestamp']), reductions
+
+def test_dedupe_drops_repeated_pings(tmp_path):
+    pings = [
+        ('id_1', 40.0, -111.0, 0, 50, 1),
+        ('id_1', 40.0, -111.0, 0, 50, 1),
+        ('id_1', 40.1, -111.1, 60, 50, 1),
+    ]
+    rows, reductions = load(tmp_path, pings, dedupe=True)
+
+    assert [row['timestamp'] for row in rows] == [0, 60]
+    assert reductions['duplicates'] == 1
+    # Summaries see each ping once
+    assert (tmp_path / 'summary.csv').read_text().count('\n') == 1
+
+def test_invalid_ping_ends_stationary_run(tmp_path):
+    pings = [
+        ('id_1', 40.0, -111.0, 0, 0, 0),
+        ('id_1', 40.0, -111.0, 60, 0, 1),
+        ('id_1', 40.0, -111.0, 120, 0, 1),
+        ('id_1', 40.0, -111.0, 180, 0, 0),
+        ('id_1', 40.0, -111.0, 240, 0, 1),
+    ]
+    rows, reductions = load(tmp_path, pings, stationary_radius=10)
+
+    # Runs break whenever validity changes, so valid pings are never flagged invalid
+    assert [(row['timestamp'], row['is_valid'], row['dwell_seconds'], row['ping_count']) for row in rows] == [
+        (0, False, 0, 1),
+        (60, True, 60, 2),
+        (180, False, 0, 1),
+        (240, True, 0, 1),
+    ]
+    assert reductions['stationary'] == 1
+
+def test_stationary_run_ends_at_route_boundary(tmp_path):
+    pings = [
+        ('id_1', 40.0, -111.0, 0, 0, 1),
+        ('id_1', 40.0, -111.0, 60, 0, 1),
+        # More than a day later the truck starts a new route without moving
+        ('id_1', 40.0, -111.0, 90000, 0, 1),
+        ('id_1', 40.0, -111.0, 90060, 0, 1),
+    ]
+    rows, reductions = load(tmp_path, pings, stationary_radius=10)
+
+    assert [(row['timestamp'], row['dwell_seconds'], row['ping_count']) for row in rows] == [
+        (0, 60, 2),
+        (90000, 60, 2),
+    ]
+    assert rows[0]['route_id'] != rows[1]['route_id']
+    assert reductions['stationary'] == 2
@@ -0,0 +1,15 @@
+import os
+import redis
+
+def invalidate_tile_cache(month):
+    """Delete the cached vector tiles of a month after its data was reloaded"""
+    try:
+        cache = redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)))
+        deleted = 0
+        # Keys are mvt:<month>:<layer>:<z>:<x>:<y>, see server/src/services/tileCache.ts
+        for key in cache.scan_iter(match=f"mvt:{month:02d}:*", count=1000):
+            cache.delete(key)
+            deleted += 1
+        print(f"Invalidated {deleted} cached tiles for month {month:02d}.")
+    except redis.RedisError as e:
+        print(f"Could not invalidate cached tiles for month {month:02d}: {e}")
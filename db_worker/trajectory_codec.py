@@ -0,0 +1,137 @@
+import numpy as np
+
+# Coordinates are stored as integers in units of 1e-5 degrees (~1.1m), speeds in
+# units of 0.1. Coordinates and timestamps are delta encoded so consecutive
+# values are small and TOAST compresses the arrays well.
+COORD_SCALE = 100000
+SPEED_SCALE = 10
+# Speeds are stored as SMALLINT, faster readings are clipped to what fits
+MAX_SPEED_UNITS = 32767
+
+def encode_track(timestamps, latitudes, longitudes, speeds, valid):
+    """Encode the points of a route into the columns of month_XX_route_tracks
+
+    Returns a dict with start_time, time_deltas, lat_deltas, lon_deltas, speeds
+    (None where the speed is unknown, clipped to MAX_SPEED_UNITS) and
+    invalid_offsets, the 0-based positions of points that were not valid.
+    Points are sorted by timestamp.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    latitudes = np.asarray(latitudes, dtype=np.float64)[order]
+    longitudes = np.asarray(longitudes, dtype=np.float64)[order]
+    speeds = np.asarray(speeds, dtype=np.float64)[order]
+    valid = np.asarray(valid, dtype=bool)[order]
+
+    # Quantize before differencing so rounding errors don't accumulate
+    lat_units = np.round(latitudes * COORD_SCALE).astype(np.int64)
+    lon_units = np.round(longitudes * COORD_SCALE).astype(np.int64)
+    speed_units = np.clip(np.round(speeds * SPEED_SCALE), -MAX_SPEED_UNITS, MAX_SPEED_UNITS)
+
+    return {
+        'start_time': int(timestamps[0]),
+        'time_deltas': np.diff(timestamps, prepend=timestamps[0]).tolist(),
+        'lat_deltas': np.diff(lat_units, prepend=0).tolist(),
+        'lon_deltas': np.diff(lon_units, prepend=0).tolist(),
+        'speeds': [None if np.isnan(s) else int(s) for s in speed_units],
+        'invalid_offsets': np.flatnonzero(~valid).tolist()
+    }
+
+def decode_track(track):
+    """Inverse of encode_track, returns numpy arrays of the route's points"""
+    timestamps = track['start_time'] + np.cumsum(np.asarray(track['time_deltas'], dtype=np.int64))
+    latitudes = np.cumsum(np.asarray(track['lat_deltas'], dtype=np.int64)) / COORD_SCALE
+    longitudes = np.cumsum(np.asarray(track['lon_deltas'], dtype=np.int64)) / COORD_SCALE
+    speeds = np.array([np.nan if s is None else s for s in track['speeds']], dtype=np.float64) / SPEED_SCALE
+    valid = np.ones(len(timestamps), dtype=bool)
+    valid[np.asarray(track['invalid_offsets'], dtype=np.int64)] = False
+
+    return {
+        'timestamps': timestamps,
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'speeds': speeds,
+        'valid': valid
+    }
+
+def pg_array(values):
+    """Format a list as a PostgreSQL array literal for COPY"""
+    return '{' + ','.join('NULL' if v is None else str(v) for v in values) + '}'
+
+def track_copy_line(route_id, truck_id, track):
+    """Return the CSV COPY line for a route's row in month_XX_route_tracks"""
+    return (f"{route_id},{truck_id},{track['start_time']},{len(track['time_deltas'])},"
+            f"\"{pg_array(track['time_deltas'])}\",\"{pg_array(track['lat_deltas'])}\","
+            f"\"{pg_array(track['lon_deltas'])}\",\"{pg_array(track['speeds'])}\","
+            f"\"{pg_array(track['invalid_offsets'])}\"\n")
+
+def create_tracks_table_sql(month):
+    """SQL creating the compact per-route table of a month"""
+    return f"""
+    CREATE TABLE IF NOT EXISTS month_{month:02d}_route_tracks (
+        route_id INT PRIMARY KEY,
+        truck_id VARCHAR(50) NOT NULL,
+        start_time BIGINT NOT NULL,
+        point_count INT NOT NULL,
+        time_deltas INT[] NOT NULL,
+        lat_deltas INT[] NOT NULL,
+        lon_deltas INT[] NOT NULL,
+        speeds SMALLINT[] NOT NULL,
+        invalid_offsets INT[] NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_route_tracks_truck_id_{month:02d} ON month_{month:02d}_route_tracks(truck_id);
+    CREATE INDEX IF NOT EXISTS idx_route_tracks_start_time_{month:02d} ON month_{month:02d}_route_tracks(start_time);
+    """
+
+# Expands a track back into one row per point, e.g.
+#   SELECT t.route_id, p.*
+#   FROM month_01_route_tracks t,
+#        decode_route_track(t.start_time, t.time_deltas, t.lat_deltas, t.lon_deltas, t.speeds, t.invalid_offsets) p
+#   WHERE t.route_id = 42;
+DECODE_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION decode_route_track(
+    start_time BIGINT, time_deltas INT[], lat_deltas INT[], lon_deltas INT[],
+    speeds SMALLINT[], invalid_offsets INT[]
+)
+RETURNS TABLE (
+    seq INT, location GEOGRAPHY(POINT), "timestamp" BIGINT, latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION, speed DOUBLE PRECISION, is_valid BOOLEAN
+)
+LANGUAGE SQL IMMUTABLE PARALLEL SAFE AS $$
+    SELECT
+        p.seq::int,
+        ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography,
+        $1 + p.time_offset,
+        p.lat,
+        p.lon,
+        p.speed::double precision / {SPEED_SCALE},
+        NOT (p.seq::int - 1 = ANY($6))
+    FROM (
+        SELECT
+            t.seq,
+            t.speed,
+            SUM(t.dt) OVER w AS time_offset,
+            (SUM(t.dlat) OVER w)::double precision / {COORD_SCALE} AS lat,
+            (SUM(t.dlon) OVER w)::double precision / {COORD_SCALE} AS lon
+        FROM UNNEST($2, $3, $4, $5) WITH ORDINALITY AS t(dt, dlat, dlon, speed, seq)
+        WINDOW w AS (ORDER BY t.seq)
+    ) p
+$$;
+"""
+
+def create_track_points_view_sql(month):
+    """SQL creating a view that expands a month's tracks into month_XX_routes columns"""
+    return f"""
+    CREATE OR REPLACE VIEW month_{month:02d}_route_track_points AS
+    SELECT
+        t.truck_id,
+        p.location,
+        p."timestamp",
+        p.speed,
+        p.is_valid,
+        TO_TIMESTAMP(p."timestamp")::date AS collection_date,
+        t.route_id
+    FROM month_{month:02d}_route_tracks t
+    CROSS JOIN LATERAL decode_route_track(t.start_time, t.time_deltas, t.lat_deltas, t.lon_deltas, t.speeds, t.invalid_offsets) p;
+    """
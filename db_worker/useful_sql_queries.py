@@ -48,6 +48,66 @@ WITH truck_routes AS (
       AND ST_Within(end_location, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326));
 """
 
+# Same as from_utah_trucks, but reads the per-route summary built by the route loader
+# instead of windowing over every point
+from_utah_routes_summary = """
+SELECT route_id, truck_id
+FROM month_01_route_summary
+WHERE ST_Within(start_point, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
+  AND NOT ST_Within(end_point, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326));
+"""
+
+# Same as to_utah_trucks, but reads the per-route summary built by the route loader
+to_utah_routes_summary = """
+SELECT route_id, truck_id
+FROM month_01_route_summary
+WHERE NOT ST_Within(start_point, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
+  AND ST_Within(end_point, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326));
+"""
+
+# Routes from any region to any other region using the memberships stored by load_regions.py
+# (here: from Utah to everywhere but Utah)
+from_region_routes = """
+SELECT route_id, truck_id
+FROM month_01_route_summary
+WHERE start_region_ids @> ARRAY[(SELECT id FROM regions WHERE name = 'Utah')]
+  AND NOT end_region_ids @> ARRAY[(SELECT id FROM regions WHERE name = 'Utah')];
+"""
+
+# Longest idle trips of a month from the per-route statistics written by the route loader
+longest_idle_routes = """
+SELECT route_id, truck_id, duration_seconds, idle_seconds, dwell_count, longest_dwell_seconds
+FROM month_01_route_stats
+ORDER BY idle_seconds DESC
+LIMIT 20;
+"""
+
+# Stops made by one route, using the links written by link_stops_to_routes.py
+route_stops = """
+SELECT s.*, l.matched_points, l.distance_m
+FROM month_01_stop_routes l
+JOIN month_01_stops s ON s.id = l.stop_row_id
+WHERE l.route_id = 1000001
+ORDER BY s.start_time;
+"""
+
+# Points of one route from the compact layout (load_route_data_into_db_parallel.py --layout compact),
+# decoded on demand. month_01_route_track_points exposes the same columns for whole-month scans.
+route_track_points = """
+SELECT t.route_id, t.truck_id, p.*
+FROM month_01_route_tracks t
+CROSS JOIN LATERAL decode_route_track(t.start_time, t.time_deltas, t.lat_deltas, t.lon_deltas, t.speeds, t.invalid_offsets) p
+WHERE t.route_id = 1000001
+ORDER BY p.seq;
+"""
+
+# Compare the on-disk size of the point and compact layouts
+route_layout_sizes = """
+SELECT
+    pg_size_pretty(pg_total_relation_size('month_01_routes')) AS points,
+    pg_size_pretty(pg_total_relation_size('month_01_route_tracks')) AS tracks;
+"""
+
 # Create a table of all the points of a truck_id that started in Utah and ended outside Utah
 create_to_utah_trucks_table = """
 CREATE TABLE from_utah_trucks AS
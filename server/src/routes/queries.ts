@@ -1,9 +1,23 @@
 import express, { Request, Response } from 'express';
 import { QueueService } from '../services/queue';
+import { TileCache, TileRenderError, TileRenderTimeout, tileCacheKey } from '../services/tileCache';
+import { renderSql } from '../services/sqlTemplates';
 import { date, z } from 'zod';
 
+// The SQL of /location, /heatmap 'raw' and 'binned', /trip_stats, /from_utah and /to_utah
+// is rendered from the templates in sql/, which db_worker/benchmark_queries.py runs too.
+
 const router = express.Router();
 const queueService = new QueueService();
+const tileCache = new TileCache();
+
+// Size in screen pixels of one aggregation cell of the /location viewport mode
+const VIEWPORT_CELL_PIXELS = 32;
+// Most cells a viewport may cover, about four 4K screens of 32px cells
+const VIEWPORT_MAX_CELLS = 40000;
+
+// Degrees covered by one viewport cell at a zoom level
+const viewportCellSize = (zoom: number) => VIEWPORT_CELL_PIXELS * 360 / (256 * 2 ** zoom);
 
 // Schema for validating the request body
 const locationQuerySchema = z.object({
@@ -13,7 +27,21 @@ const locationQuerySchema = z.object({
         south: z.number(),
         east: z.number(),
         north: z.number()
-    })
+    }),
+    // Map zoom level, when given the points in view are returned as per-cell counts
+    zoom: z.number().int().min(0).max(20).optional()
+}).refine((data) => {
+    // A viewport much larger than the screen at this zoom would produce millions of cells
+    if (data.zoom === undefined) {
+        return true;
+    }
+    const cellSize = viewportCellSize(data.zoom);
+    const columns = Math.abs(data.bounds.east - data.bounds.west) / cellSize;
+    const rows = Math.abs(data.bounds.north - data.bounds.south) / cellSize;
+    return columns * rows <= VIEWPORT_MAX_CELLS;
+}, {
+    message: `Bounds are too large for the requested zoom`,
+    path: ["bounds"],
 });
 
 // Schema for validating the development SQL query
@@ -27,7 +55,73 @@ const heatmapQuerySchema = z.object({
     startDate: z.string().datetime(),
     endDate: z.string().datetime(),
     eps: z.number().positive(),
-    minSamples: z.number().int().positive()
+    minSamples: z.number().int().positive(),
+    // 'raw' ships every stop to the worker, 'binned' aggregates stops into
+    // grid cells in SQL first and clusters the cells weighted by stop count,
+    // 'summary' merges the daily cells precomputed by materialize_heatmap_summaries.py,
+    // 'approximate' clusters a random sample of the stops and scales the counts back up
+    mode: z.enum(['raw', 'binned', 'summary', 'approximate']).default('raw'),
+    // Grid cell size in degrees for 'binned' mode, defaults to a quarter of eps
+    binSize: z.number().positive().optional(),
+    // Fraction of stops sampled in 'approximate' mode
+    sampleFraction: z.number().positive().max(1).default(0.01)
+});
+
+// Decimal places eps is stored with in heatmap_daily_bins, see materialize_heatmap_summaries.py
+const EPS_DIGITS = 8;
+
+// Job params letting the heatmap worker bin the stops of days in the range that have no
+// daily summary for eps. missingDaysQuery lists those days, fallbackQuery is run on each
+// month table with {month} replaced and :days bound to them.
+const summaryFallback = (startDate: string, endDate: string, eps: number, gridSize: number) => {
+    const firstDay = startDate.slice(0, 10);
+    const lastDay = endDate.slice(0, 10);
+    return {
+        missingDaysQuery: `
+            SELECT d::date as day
+            FROM generate_series('${firstDay}'::date, '${lastDay}'::date, INTERVAL '1 day') d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM heatmap_daily_bins b
+                WHERE b.eps = ROUND(${eps}::numeric, ${EPS_DIGITS})
+                AND b.day = d::date
+            )
+            ORDER BY day;
+        `,
+        fallbackQuery: `
+            SELECT
+                AVG(ST_Y(location::geometry)) as latitude,
+                AVG(ST_X(location::geometry)) as longitude,
+                COUNT(*) as stop_count,
+                SUM(duration_minutes) as duration_sum
+            FROM month_{month}_stops
+            WHERE start_time >= '${firstDay}'::date
+            AND start_time < '${lastDay}'::date + 1
+            AND start_time::date = ANY(:days)
+            GROUP BY ST_SnapToGrid(location::geometry, ${gridSize});
+        `,
+        fallbackMonths: monthsInRange(startDate, endDate),
+        rangeDays: Math.round((Date.parse(lastDay) - Date.parse(firstDay)) / 86400000) + 1
+    };
+};
+
+// Hash buckets 'approximate' heatmaps sample from, a power of two
+const SAMPLE_HASH_BUCKETS = 1048576;
+
+// Zoom levels build_heatmap_tiles.py builds by default (--min-zoom / --max-zoom).
+// Requests outside them are served from the nearest built level.
+const HEATMAP_TILE_MIN_ZOOM = 3;
+const HEATMAP_TILE_MAX_ZOOM = 14;
+
+// Schema for validating the heatmap tile request
+const heatmapTilesQuerySchema = z.object({
+    month: z.number().min(1).max(12),
+    zoom: z.number().int().min(0).max(20),
+    bounds: z.object({
+        west: z.number(),
+        south: z.number(),
+        east: z.number(),
+        north: z.number()
+    })
 });
 
 // Schema for validating the Utah boundary request
@@ -35,6 +129,8 @@ const utahBoundarySchema = z.object({
     startDate: z.string().datetime(),
     endDate: z.string().datetime(),
     month: z.number().min(1).max(12),
+    // Map zoom level, when given whole routes are returned simplified for that zoom
+    zoom: z.number().int().min(0).max(20).optional(),
 }).refine((data) => {
     // Check if the date range is within the specified month
     const start = new Date(data.startDate);
@@ -46,27 +142,204 @@ const utahBoundarySchema = z.object({
     path: ["startDate", "endDate"],
 });
 
+// Schema for validating the origin/destination flow request
+const odFlowsSchema = z.object({
+    startDate: z.string().datetime(),
+    endDate: z.string().datetime(),
+    // ids from the regions table, see GET /regions
+    originRegionId: z.number().int().positive(),
+    destinationRegionId: z.number().int().positive()
+}).refine((data) => {
+    // Month tables hold a single year, so the range may span months but not years
+    const start = new Date(data.startDate);
+    const end = new Date(data.endDate);
+    return start <= end && start.getFullYear() === end.getFullYear();
+}, {
+    message: `Date range must be ordered and within a single year`,
+    path: ["startDate", "endDate"],
+});
+
+// Schema for validating the trip statistics request
+const tripStatsSchema = z.object({
+    month: z.number().min(1).max(12),
+    startDate: z.string().datetime(),
+    endDate: z.string().datetime(),
+    truckId: z.string().max(50).regex(/^[A-Za-z0-9_-]+$/).optional(),
+    // Column of month_XX_route_stats the returned routes are sorted by, descending
+    orderBy: z.enum(['distance_km', 'duration_seconds', 'idle_seconds', 'dwell_seconds', 'max_speed', 'invalid_ratio']).default('distance_km'),
+    routeLimit: z.number().int().min(0).max(1000).default(100)
+}).refine((data) => {
+    // Check if the date range is within the specified month
+    const start = new Date(data.startDate);
+    const end = new Date(data.endDate);
+    const monthsMatch = start.getMonth() === (data.month - 1);
+    return start.getMonth() === end.getMonth() && start.getFullYear() === end.getFullYear() && monthsMatch;
+}, {
+    message: `Date range must be within the specified month`,
+    path: ["startDate", "endDate"],
+});
+
+// Schema for validating the stops of a route request
+const routeStopsSchema = z.object({
+    month: z.number().min(1).max(12),
+    routeId: z.number().int().positive()
+});
+
+// Schema for validating the delivery time prediction request
+const predictDeliverySchema = z.object({
+    trips: z.array(z.object({
+        // ids from the regions table, see GET /regions
+        originRegionId: z.number().int().nonnegative(),
+        destinationRegionId: z.number().int().nonnegative(),
+        departure: z.string().datetime(),
+        // Defaults to the median route distance of the corridor
+        distanceKm: z.number().positive().optional()
+    })).min(1).max(1000)
+});
+
+// Months (1-12) touched by a date range within one year
+const monthsInRange = (startDate: string, endDate: string) => {
+    const first = new Date(startDate).getMonth() + 1;
+    const last = new Date(endDate).getMonth() + 1;
+    return Array.from({ length: last - first + 1 }, (_, i) => first + i);
+};
+
+// Schema for validating vector tile requests
+const vectorTileSchema = z.object({
+    layer: z.enum(['routes', 'stops']),
+    month: z.coerce.number().int().min(1).max(12),
+    z: z.coerce.number().int().min(0).max(20),
+    x: z.coerce.number().int().min(0),
+    y: z.coerce.number().int().min(0)
+}).refine((data) => data.x < 2 ** data.z && data.y < 2 ** data.z, {
+    message: 'Tile coordinates out of range for zoom level',
+    path: ['x', 'y'],
+});
+
+// How long a tile request waits for the worker to render an uncached tile
+const TILE_RENDER_TIMEOUT_MS = 30000;
+
+// Web mercator tile containing a point at the given zoom level
+const tileForPoint = (longitude: number, latitude: number, zoom: number) => {
+    const n = 2 ** zoom;
+    const lat = Math.max(Math.min(latitude, 85.05112878), -85.05112878) * Math.PI / 180;
+    const x = Math.floor((longitude + 180) / 360 * n);
+    const y = Math.floor((1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * n);
+    return {
+        x: Math.min(Math.max(x, 0), n - 1),
+        y: Math.min(Math.max(y, 0), n - 1)
+    };
+};
+
+// Select the points of the routes in the qualifying_trucks CTE. Without a zoom level the
+// raw points are returned (capped at 1000). With a zoom level every route is returned
+// whole from the shapes precomputed by simplify_routes.py, at the coarsest tolerance
+// that is still below one screen pixel.
+const routePointsQuery = (month: number, zoom?: number) => {
+    const monthPrefix = `month_${month.toString().padStart(2, '0')}`;
+    if (zoom === undefined) {
+        return renderSql('route_points', { month_prefix: monthPrefix });
+    }
+
+    // Degrees covered by one pixel of a 256px tile at this zoom level
+    const pixelDegrees = 360 / (256 * 2 ** zoom);
+    return renderSql('route_points_zoom', { month_prefix: monthPrefix, pixel_degrees: pixelDegrees });
+};
+
+// Points of the routes starting (or not) and ending (or not) in Utah, see routePointsQuery
+const utahRoutesQuery = (month: number, startDate: string, endDate: string, startsInUtah: boolean, endsInUtah: boolean, zoom?: number) =>
+    renderSql('utah_routes', {
+        month_prefix: `month_${month.toString().padStart(2, '0')}`,
+        start_utah: startsInUtah ? '' : 'NOT',
+        end_utah: endsInUtah ? '' : 'NOT',
+        start_date: startDate,
+        end_date: endDate,
+        route_points: routePointsQuery(month, zoom)
+    });
+
+// Render a z/x/y Mapbox Vector Tile. Routes are drawn from the shapes precomputed by
+// simplify_routes.py at the coarsest tolerance below one pixel, stops are merged per
+// tile pixel with a count so dense areas stay small at low zoom levels.
+const vectorTileQuery = (layer: 'routes' | 'stops', month: number, z: number, x: number, y: number) => {
+    const monthPrefix = `month_${month.toString().padStart(2, '0')}`;
+    const bounds = `
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(${z}, ${x}, ${y}) AS geom,
+                   ST_Transform(ST_TileEnvelope(${z}, ${x}, ${y}), 4326) AS geom_4326
+        )`;
+
+    if (layer === 'routes') {
+        const pixelDegrees = 360 / (256 * 2 ** z);
+        return `${bounds},
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(ST_Force2D(s.geom), 3857), bounds.geom) AS geom,
+                s.route_id
+            FROM ${monthPrefix}_route_shapes s, bounds
+            WHERE s.geom && bounds.geom_4326
+            AND s.tolerance = COALESCE(
+                (SELECT MAX(tolerance) FROM ${monthPrefix}_route_shapes WHERE tolerance <= ${pixelDegrees}),
+                (SELECT MIN(tolerance) FROM ${monthPrefix}_route_shapes)
+            )
+        )
+        SELECT COALESCE(ST_AsMVT(mvtgeom.*, 'routes'), ''::bytea) AS tile
+        FROM mvtgeom
+        WHERE geom IS NOT NULL;
+        `;
+    }
+
+    return `${bounds},
+        mvtgeom AS (
+            SELECT geom, COUNT(*) AS count, AVG(duration_minutes) AS avg_duration_minutes
+            FROM (
+                SELECT
+                    ST_AsMVTGeom(ST_Transform(s.location::geometry, 3857), bounds.geom) AS geom,
+                    s.duration_minutes
+                FROM ${monthPrefix}_stops s, bounds
+                -- as geometry like the routes layer, a geography envelope spanning
+                -- the world collapses and misses most points at low zoom
+                WHERE s.location::geometry && bounds.geom_4326
+            ) p
+            WHERE geom IS NOT NULL
+            GROUP BY geom
+        )
+        SELECT COALESCE(ST_AsMVT(mvtgeom.*, 'stops'), ''::bytea) AS tile
+        FROM mvtgeom;
+    `;
+};
+
 // Initialize queue connection
 queueService.connect().catch(console.error);
 
 router.post('/location', async (req: Request, res: Response) => {
     try {
         // Validate request body
-        const { month, bounds } = locationQuerySchema.parse(req.body);
+        const { month, bounds, zoom } = locationQuerySchema.parse(req.body);
 
-        // TODO: parameterize the query. because we are using zod, sql injection should not be an issue, but it's good practice to do so
-        const query = `
-            SELECT *
-            FROM ${month}
-            WHERE ST_Within(
-                location::geometry,
-                ST_MakeEnvelope(${bounds.west}, ${bounds.south}, ${bounds.east}, ${bounds.north}, 4326)
-            ) LIMIT 10;
-        `;
+        // The viewport is a lat/lon rectangle, so it is compared as geometry. A geography
+        // box has great-circle edges and misses points near the rectangle's edges.
+        const view = { table: month, ...bounds };
 
-        const job = await queueService.submitQuery(query, {
-            type: 'regular'
-        });
+        let job;
+        if (zoom === undefined) {
+            // TODO: parameterize the query. because we are using zod, sql injection should not be an issue, but it's good practice to do so
+            const query = renderSql('location', view);
+
+            job = await queueService.submitQuery(query, {
+                type: 'regular'
+            });
+        } else {
+            // Count the points in view per grid cell of VIEWPORT_CELL_PIXELS screen pixels
+            const cellSize = viewportCellSize(zoom);
+            const query = renderSql('location_grid', { ...view, cell_size: cellSize });
+
+            job = await queueService.submitQuery(query, {
+                type: 'viewport',
+                params: {
+                    cellSize
+                }
+            });
+        }
 
         res.json({
             jobId: job.id,
@@ -148,27 +421,71 @@ router.post('/dev/execute', async (req: Request, res: Response) => {
 router.post('/heatmap', async (req: Request, res: Response) => {
     try {
         // Validate request body
-        const { month, startDate, endDate, eps, minSamples } = heatmapQuerySchema.parse(req.body);
+        const { month, startDate, endDate, eps, minSamples, mode, binSize, sampleFraction } = heatmapQuerySchema.parse(req.body);
+        const table = `month_${month.toString().padStart(2, '0')}_stops`;
+
+        // eps is in radians because the worker clusters with the haversine metric.
+        // Daily summaries are binned at a quarter of eps (bin_size_for_eps in
+        // materialize_heatmap_summaries.py).
+        const summaryGridSize = (eps * 180 / Math.PI) / 4;
+        const gridSize = binSize ?? summaryGridSize;
+        const range = { table, start_date: startDate, end_date: endDate };
+
+        // 'approximate' keeps rows whose id hashes below the threshold. It is at least 1 so
+        // tiny fractions still sample some rows, and the worker scales by the fraction
+        // actually sampled.
+        const sampleThreshold = Math.max(1, Math.round(sampleFraction * SAMPLE_HASH_BUCKETS));
 
         // Create the query to fetch data from the database
-        const query = `
-            SELECT 
-                stop_id,
-                ST_Y(location::geometry) as latitude,
-                ST_X(location::geometry) as longitude,
-                start_time,
-                end_time,
-                duration_minutes
-            FROM month_${month.toString().padStart(2, '0')}_stops
-            WHERE start_time >= '${startDate}'
-            AND end_time <= '${endDate}';
-        `;
+        let query: string;
+        if (mode === 'binned') {
+            query = renderSql('heatmap_binned', { ...range, grid_size: gridSize });
+        } else if (mode === 'summary') {
+            // Stops are summarized by the day they start on, so the range is day-granular
+            // and can cross months. eps is stored rounded to EPS_DIGITS so values that
+            // differ only by float rounding match. Days of the range without a summary
+            // for the eps are binned from the stop tables of every month in the range by
+            // the worker, which reports them as unsummarized_days.
+            query = `
+                SELECT
+                    SUM(latitude * stop_count) / SUM(stop_count) as latitude,
+                    SUM(longitude * stop_count) / SUM(stop_count) as longitude,
+                    SUM(stop_count)::bigint as stop_count,
+                    SUM(duration_sum)::bigint as duration_sum
+                FROM heatmap_daily_bins
+                WHERE eps = ROUND(${eps}::numeric, ${EPS_DIGITS})
+                AND day BETWEEN '${startDate}'::date AND '${endDate}'::date
+                GROUP BY cell_x, cell_y;
+            `;
+        } else if (mode === 'approximate') {
+            // TABLESAMPLE is applied before the WHERE clause and reads the table without
+            // the start_time index, so for a narrow range it would cost more than the raw
+            // query it previews, and SYSTEM sampling keeps whole pages of correlated stops.
+            // Instead the indexed range is sampled by a hash of the row id: every visit has
+            // the same independent inclusion probability, so the scaled counts and their
+            // reported errors hold, and identical requests return the same preview. Hashing
+            // stop_id would keep or drop every visit to a location together.
+            query = `
+                SELECT 
+                    ST_Y(location::geometry) as latitude,
+                    ST_X(location::geometry) as longitude,
+                    duration_minutes
+                FROM ${table}
+                WHERE start_time >= '${startDate}'
+                AND end_time <= '${endDate}'
+                AND (hashtext(id::text)::bigint & ${SAMPLE_HASH_BUCKETS - 1}) < ${sampleThreshold};
+            `;
+        } else {
+            query = renderSql('heatmap_raw', range);
+        }
         // Submit the query to the queue with additional parameters
         const job = await queueService.submitQuery(query, {
             type: 'heatmap',
             params: {
                 eps,
-                minSamples
+                minSamples,
+                ...(mode === 'approximate' ? { sampleFraction: sampleThreshold / SAMPLE_HASH_BUCKETS } : {}),
+                ...(mode === 'summary' ? summaryFallback(startDate, endDate, eps, summaryGridSize) : {})
             }
         });
 
@@ -192,43 +509,310 @@ router.post('/heatmap', async (req: Request, res: Response) => {
     }
 });
 
-router.post('/from_utah', async (req: Request, res: Response) => {
+router.post('/heatmap_tiles', async (req: Request, res: Response) => {
     try {
         // Validate request body
-        const { month, startDate, endDate } = utahBoundarySchema.parse(req.body);
+        const { month, zoom: requestedZoom, bounds } = heatmapTilesQuerySchema.parse(req.body);
+        const zoom = Math.min(Math.max(requestedZoom, HEATMAP_TILE_MIN_ZOOM), HEATMAP_TILE_MAX_ZOOM);
 
-        // Query to get all points from trucks that start in Utah and end outside
+        // Tiles are built by build_heatmap_tiles.py, so only the tiles in view are fetched
+        const topLeft = tileForPoint(bounds.west, bounds.north, zoom);
+        const bottomRight = tileForPoint(bounds.east, bounds.south, zoom);
         const query = `
-            WITH qualifying_trucks AS (
-                SELECT DISTINCT route_id
-                FROM (
-                    SELECT
-                        route_id,
-                        FIRST_VALUE(location) OVER (PARTITION BY route_id ORDER BY timestamp) AS start_location,
-                        FIRST_VALUE(location) OVER (PARTITION BY route_id ORDER BY timestamp DESC) AS end_location,
-                        FIRST_VALUE(timestamp) OVER (PARTITION BY route_id ORDER BY timestamp) AS first_timestamp
-                    FROM month_${month.toString().padStart(2, '0')}_routes
-                ) tr
-                WHERE ST_Within(tr.start_location::geometry, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
-                  AND NOT ST_Within(tr.end_location::geometry, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
-                  AND tr.first_timestamp BETWEEN EXTRACT(EPOCH FROM '${startDate}'::timestamp)::bigint 
-                                        AND EXTRACT(EPOCH FROM '${endDate}'::timestamp)::bigint
-            )
-            SELECT 
-                r.route_id,
-                r.timestamp,
-                ST_Y(r.location::geometry) as latitude,
-                ST_X(r.location::geometry) as longitude
-            FROM month_${month.toString().padStart(2, '0')}_routes r
-            INNER JOIN qualifying_trucks qt ON r.route_id = qt.route_id
-            ORDER BY r.route_id, r.timestamp
-            LIMIT 1000;
+            SELECT z, x, y, cells, counts, max_count
+            FROM heatmap_tiles
+            WHERE month = ${month}
+            AND z = ${zoom}
+            AND x BETWEEN ${topLeft.x} AND ${bottomRight.x}
+            AND y BETWEEN ${topLeft.y} AND ${bottomRight.y};
+        `;
+
+        const job = await queueService.submitQuery(query, {
+            type: 'heatmap_tiles',
+            params: {
+                zoom,
+                requestedZoom
+            }
+        });
+
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Heatmap tile job submitted successfully'
+        });
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else {
+            console.error('Error submitting heatmap tile query:', error);
+            res.status(500).json({
+                error: 'Failed to submit heatmap tile query'
+            });
+        }
+    }
+});
+
+router.get('/tiles/:layer/:month/:z/:x/:y', async (req: Request, res: Response) => {
+    try {
+        const { layer, month, z: zoom, x, y } = vectorTileSchema.parse(req.params);
+        const cacheKey = tileCacheKey(month, layer, zoom, x, y);
+
+        // Render the tile in the worker on a cache miss, the worker stores it in the cache
+        const tile = await tileCache.getOrRender(cacheKey, () => queueService.submitQuery(vectorTileQuery(layer, month, zoom, x, y), {
+            type: 'mvt',
+            params: {
+                cacheKey
+            }
+        }), TILE_RENDER_TIMEOUT_MS);
+
+        res.set('Content-Type', 'application/vnd.mapbox-vector-tile');
+        res.send(tile);
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else if (error instanceof TileRenderTimeout) {
+            res.status(504).json({ error: 'Timed out rendering tile' });
+        } else if (error instanceof TileRenderError) {
+            res.status(500).json({ error: 'Failed to render tile', details: error.message });
+        } else {
+            console.error('Error serving vector tile:', error);
+            res.status(500).json({
+                error: 'Failed to serve tile'
+            });
+        }
+    }
+});
+
+router.get('/regions', async (req: Request, res: Response) => {
+    try {
+        const query = `
+            SELECT id, name, kind
+            FROM regions
+            ORDER BY kind, name;
         `;
 
         const job = await queueService.submitQuery(query, {
             type: 'regular'
         });
 
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Query submitted successfully'
+        });
+    } catch (error) {
+        console.error('Error submitting regions query:', error);
+        res.status(500).json({
+            error: 'Failed to submit query'
+        });
+    }
+});
+
+router.post('/od_flows', async (req: Request, res: Response) => {
+    try {
+        // Validate request body
+        const { startDate, endDate, originRegionId, destinationRegionId } = odFlowsSchema.parse(req.body);
+
+        // Daily flows of routes that start in the origin region and end in the destination
+        // region. Region membership is computed when routes are loaded (see load_regions.py).
+        // The worker runs the query on every month in the range concurrently, {month} is
+        // replaced per month, and merges the daily rows.
+        const query = `
+            SELECT
+                TO_TIMESTAMP(start_time)::date as day,
+                COUNT(*) as routes,
+                COUNT(DISTINCT truck_id) as trucks,
+                AVG(end_time - start_time) / 3600.0 as avg_duration_hours,
+                AVG(distance_km) as avg_distance_km
+            FROM month_{month}_route_summary
+            WHERE start_region_ids @> ARRAY[${originRegionId}]
+              AND end_region_ids @> ARRAY[${destinationRegionId}]
+              AND start_time BETWEEN EXTRACT(EPOCH FROM '${startDate}'::timestamp)::bigint 
+                                AND EXTRACT(EPOCH FROM '${endDate}'::timestamp)::bigint
+            GROUP BY day;
+        `;
+
+        const job = await queueService.submitQuery(query, {
+            type: 'fanout',
+            params: {
+                months: monthsInRange(startDate, endDate),
+                merge: {
+                    groupBy: ['day'],
+                    // A route is stored in the month it was loaded with, so a day's
+                    // trucks are only split across months at month boundaries
+                    sum: ['routes', 'trucks'],
+                    avg: {
+                        avg_duration_hours: 'routes',
+                        avg_distance_km: 'routes'
+                    },
+                    orderBy: ['day']
+                }
+            }
+        });
+
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Query submitted successfully'
+        });
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else {
+            console.error('Error submitting O/D flow query:', error);
+            res.status(500).json({
+                error: 'Failed to submit query'
+            });
+        }
+    }
+});
+
+router.post('/trip_stats', async (req: Request, res: Response) => {
+    try {
+        // Validate request body
+        const { month, startDate, endDate, truckId, orderBy, routeLimit } = tripStatsSchema.parse(req.body);
+
+        // Per-route statistics are computed by the route loader, so this is an
+        // index scan on start_time instead of window queries over every point
+        const query = renderSql('trip_stats', {
+            month_prefix: `month_${month.toString().padStart(2, '0')}`,
+            start_date: startDate,
+            end_date: endDate,
+            truck_filter: truckId ? `AND truck_id = '${truckId}'` : '',
+            order_by: orderBy
+        });
+
+        const job = await queueService.submitQuery(query, {
+            type: 'trip_stats',
+            params: {
+                routeLimit
+            }
+        });
+
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Query submitted successfully'
+        });
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else {
+            console.error('Error submitting trip statistics query:', error);
+            res.status(500).json({
+                error: 'Failed to submit query'
+            });
+        }
+    }
+});
+
+router.post('/route_stops', async (req: Request, res: Response) => {
+    try {
+        // Validate request body
+        const { month, routeId } = routeStopsSchema.parse(req.body);
+        const monthPrefix = `month_${month.toString().padStart(2, '0')}`;
+
+        // Stops are linked to routes by link_stops_to_routes.py, so this is an index lookup
+        const query = `
+            SELECT
+                s.id,
+                s.stop_id,
+                s.address,
+                ST_Y(s.location::geometry) as latitude,
+                ST_X(s.location::geometry) as longitude,
+                s.start_time,
+                s.end_time,
+                s.duration_minutes,
+                l.truck_id,
+                l.matched_points,
+                l.distance_m
+            FROM ${monthPrefix}_stop_routes l
+            JOIN ${monthPrefix}_stops s ON s.id = l.stop_row_id
+            WHERE l.route_id = ${routeId}
+            ORDER BY s.start_time;
+        `;
+
+        const job = await queueService.submitQuery(query, {
+            type: 'regular'
+        });
+
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Query submitted successfully'
+        });
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else {
+            console.error('Error submitting route stops query:', error);
+            res.status(500).json({
+                error: 'Failed to submit query'
+            });
+        }
+    }
+});
+
+router.post('/predict_delivery', async (req: Request, res: Response) => {
+    try {
+        // Validate request body
+        const { trips } = predictDeliverySchema.parse(req.body);
+
+        // The worker predicts with the model trained by delivery_model.py, no SQL is run
+        const job = await queueService.submitQuery('-- delivery time prediction', {
+            type: 'prediction',
+            params: {
+                trips
+            }
+        });
+
+        res.json({
+            jobId: job.id,
+            status: job.status,
+            message: 'Query submitted successfully'
+        });
+    } catch (error) {
+        if (error instanceof z.ZodError) {
+            res.status(400).json({
+                error: 'Invalid request format',
+                details: error.errors
+            });
+        } else {
+            console.error('Error submitting delivery prediction:', error);
+            res.status(500).json({
+                error: 'Failed to submit query'
+            });
+        }
+    }
+});
+
+router.post('/from_utah', async (req: Request, res: Response) => {
+    try {
+        // Validate request body
+        const { month, startDate, endDate, zoom } = utahBoundarySchema.parse(req.body);
+
+        // Query to get all points from trucks that start in Utah and end outside
+        const query = utahRoutesQuery(month, startDate, endDate, true, false, zoom);
+
+        const job = await queueService.submitQuery(query, {
+            type: 'regular'
+        });
+
         res.json({
             jobId: job.id,
             status: job.status,
@@ -253,33 +837,8 @@ router.post('/to_utah', async (req: Request, res: Response) => {
     try {
         // Validate request body
         // Query to get all points from trucks that start outside Utah and end inside
-        const { month, startDate, endDate } = utahBoundarySchema.parse(req.body);
-        const query = `
-            WITH qualifying_trucks AS (
-                SELECT DISTINCT route_id
-                FROM (
-                    SELECT
-                        route_id,
-                        FIRST_VALUE(location) OVER (PARTITION BY route_id ORDER BY timestamp) AS start_location,
-                        FIRST_VALUE(location) OVER (PARTITION BY route_id ORDER BY timestamp DESC) AS end_location,
-                        FIRST_VALUE(timestamp) OVER (PARTITION BY route_id ORDER BY timestamp) AS first_timestamp
-                    FROM month_${month.toString().padStart(2, '0')}_routes
-                ) tr
-                WHERE NOT ST_Within(tr.start_location::geometry, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
-                  AND ST_Within(tr.end_location::geometry, ST_MakeEnvelope(-114.064453, 37.026061, -109.054687, 42.008507, 4326))
-                  AND tr.first_timestamp BETWEEN EXTRACT(EPOCH FROM '${startDate}'::timestamp)::bigint 
-                                        AND EXTRACT(EPOCH FROM '${endDate}'::timestamp)::bigint
-            )
-            SELECT 
-                r.route_id,
-                r.timestamp,
-                ST_Y(r.location::geometry) as latitude,
-                ST_X(r.location::geometry) as longitude
-            FROM month_${month.toString().padStart(2, '0')}_routes r
-            INNER JOIN qualifying_trucks qt ON r.route_id = qt.route_id
-            ORDER BY r.route_id, r.timestamp
-            LIMIT 1000;
-        `;
+        const { month, startDate, endDate, zoom } = utahBoundarySchema.parse(req.body);
+        const query = utahRoutesQuery(month, startDate, endDate, false, true, zoom);
 
         const job = await queueService.submitQuery(query, {
             type: 'regular'
@@ -12,12 +12,13 @@ interface QueryParams {
 export class QueueService {
     private connection: amqp.ChannelModel | null = null;
     private channel: amqp.Channel | null = null;
+    private declaredQueues = new Set<string>();
 
     async connect() {
         try {
             this.connection = await amqp.connect(process.env.RABBITMQ_URL || 'amqp://localhost');
             this.channel = await this.connection.createChannel();
-            await this.channel.assertQueue(QUEUE_NAME, { durable: true });
+            this.declaredQueues.clear();
         } catch (error) {
             console.error('Failed to connect to RabbitMQ:', error);
             throw error;
@@ -37,11 +38,20 @@ export class QueueService {
             }
         });
 
+        // Every job type has its own queue, so workers can be scaled per type
+        // (see WORKER_JOB_TYPES in db_worker/src/worker.py)
+        const type = options?.type || 'regular';
+        const queue = `${QUEUE_NAME}.${type}`;
+        if (!this.declaredQueues.has(queue)) {
+            await this.channel.assertQueue(queue, { durable: true });
+            this.declaredQueues.add(queue);
+        }
+
         // Send the job to the queue
-        await this.channel.sendToQueue(QUEUE_NAME, Buffer.from(JSON.stringify({
+        await this.channel.sendToQueue(queue, Buffer.from(JSON.stringify({
             jobId: queryJob.id,
             query,
-            type: options?.type || 'regular',
+            type,
             params: options?.params || {}
         })));
 
@@ -58,6 +68,7 @@ export class QueueService {
         if (this.channel) {
             await this.channel.close();
             this.channel = null;
+            this.declaredQueues.clear();
         }
         if (this.connection) {
             await this.connection.close();
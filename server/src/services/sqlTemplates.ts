@@ -0,0 +1,34 @@
+import fs from 'fs';
+import path from 'path';
+
+// SQL templates in the repository's sql/ directory, shared with render_sql() in
+// db_worker/benchmark_queries.py so the benchmark runs exactly what the server sends.
+// docker-compose mounts the directory at /app/sql, outside docker it is next to server/.
+const SQL_DIRS = [
+    path.join(__dirname, '..', '..', 'sql'),
+    path.join(__dirname, '..', '..', '..', 'sql')
+];
+
+const templates = new Map<string, string>();
+
+const readTemplate = (name: string) => {
+    let template = templates.get(name);
+    if (template === undefined) {
+        const dir = SQL_DIRS.find(candidate => fs.existsSync(path.join(candidate, `${name}.sql`)));
+        if (!dir) {
+            throw new Error(`SQL template ${name}.sql not found in ${SQL_DIRS.join(', ')}`);
+        }
+        template = fs.readFileSync(path.join(dir, `${name}.sql`), 'utf8');
+        templates.set(name, template);
+    }
+    return template;
+};
+
+// Render sql/<name>.sql, replacing every {{key}} with values[key]
+export const renderSql = (name: string, values: Record<string, string | number>) =>
+    readTemplate(name).replace(/\{\{(\w+)\}\}/g, (_, key: string) => {
+        if (!(key in values)) {
+            throw new Error(`No value for {{${key}}} in ${name}.sql`);
+        }
+        return String(values[key]);
+    });
@@ -0,0 +1,131 @@
+import Redis from 'ioredis';
+
+// Tiles are cached by the db_worker mvt handler under mvt:<month>:<layer>:<z>:<x>:<y>.
+// Loaders delete a month's keys when its data is reloaded.
+export const tileCacheKey = (month: number, layer: string, z: number, x: number, y: number) =>
+    `mvt:${month.toString().padStart(2, '0')}:${layer}:${z}:${x}:${y}`;
+
+// The mvt handler publishes {cacheKey, error?} here after every render and deletes
+// the tile's render lock. Must match RENDERED_CHANNEL in db_worker/src/handlers/mvt_handler.py
+const RENDERED_CHANNEL = 'mvt:rendered';
+
+export const renderLockKey = (cacheKey: string) => `lock:${cacheKey}`;
+
+export class TileRenderTimeout extends Error {}
+
+export class TileRenderError extends Error {}
+
+type Waiter = {
+    resolve: () => void;
+    reject: (error: Error) => void;
+};
+
+export class TileCache {
+    private client: Redis;
+    private subscriber: Redis;
+    private subscribed: Promise<unknown> | null = null;
+    // Renders this process is waiting for, shared by every request for the same tile
+    private inflight = new Map<string, Promise<Buffer>>();
+    private waiters = new Map<string, Waiter[]>();
+
+    constructor() {
+        this.client = new Redis({
+            host: process.env.REDIS_HOST || 'localhost',
+            port: parseInt(process.env.REDIS_PORT || '6379'),
+            lazyConnect: true
+        });
+        // A connection in subscriber mode can't run other commands
+        this.subscriber = this.client.duplicate();
+        this.subscriber.on('message', (channel: string, message: string) => {
+            const { cacheKey, error } = JSON.parse(message);
+            const waiters = this.waiters.get(cacheKey) || [];
+            this.waiters.delete(cacheKey);
+            for (const waiter of waiters) {
+                if (error) {
+                    waiter.reject(new TileRenderError(error));
+                } else {
+                    waiter.resolve();
+                }
+            }
+        });
+    }
+
+    async get(key: string): Promise<Buffer | null> {
+        return this.client.getBuffer(key);
+    }
+
+    // Resolve when the worker publishes a render of key, or reject after timeoutMs
+    private waitForRender(key: string, timeoutMs: number) {
+        let waiter!: Waiter;
+        const rendered = new Promise<void>((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.waiters.set(key, (this.waiters.get(key) || []).filter(w => w !== waiter));
+                reject(new TileRenderTimeout(`Timed out rendering ${key}`));
+            }, timeoutMs);
+            waiter = {
+                resolve: () => { clearTimeout(timer); resolve(); },
+                reject: (error) => { clearTimeout(timer); reject(error); }
+            };
+        });
+        // The render can fail while the caller is still submitting the job
+        rendered.catch(() => {});
+        this.waiters.set(key, [...(this.waiters.get(key) || []), waiter]);
+        return { rendered, cancel: () => waiter.resolve() };
+    }
+
+    // Return a cached tile, rendering it with submit on a miss. Requests for the same
+    // tile share one render: within this process through the in-flight map, across
+    // server processes through a Redis lock that only the submitting request holds.
+    // Waiters are notified over pub/sub instead of polling.
+    async getOrRender(key: string, submit: () => Promise<unknown>, timeoutMs: number): Promise<Buffer> {
+        const cached = await this.get(key);
+        if (cached !== null) {
+            return cached;
+        }
+
+        let render = this.inflight.get(key);
+        if (!render) {
+            render = this.render(key, submit, timeoutMs).finally(() => this.inflight.delete(key));
+            this.inflight.set(key, render);
+        }
+        return render;
+    }
+
+    private async render(key: string, submit: () => Promise<unknown>, timeoutMs: number): Promise<Buffer> {
+        if (!this.subscribed) {
+            this.subscribed = this.subscriber.subscribe(RENDERED_CHANNEL);
+        }
+        await this.subscribed;
+
+        // Listen before checking again, so a render finishing in between isn't missed
+        const { rendered, cancel } = this.waitForRender(key, timeoutMs);
+        const tile = await this.get(key);
+        if (tile !== null) {
+            cancel();
+            return tile;
+        }
+
+        const locked = await this.client.set(renderLockKey(key), '1', 'PX', timeoutMs, 'NX');
+        if (locked) {
+            try {
+                await submit();
+            } catch (error) {
+                cancel();
+                await this.client.del(renderLockKey(key));
+                throw error;
+            }
+        }
+        await rendered;
+
+        const renderedTile = await this.get(key);
+        if (renderedTile === null) {
+            throw new TileRenderError(`Rendered tile ${key} was evicted from the cache`);
+        }
+        return renderedTile;
+    }
+
+    async close() {
+        await this.subscriber.quit();
+        await this.client.quit();
+    }
+}
@@ -0,0 +1,10 @@
+-- /heatmap 'binned' mode, one row per grid cell of grid_size degrees
+SELECT
+    AVG(ST_Y(location::geometry)) as latitude,
+    AVG(ST_X(location::geometry)) as longitude,
+    COUNT(*) as stop_count,
+    SUM(duration_minutes) as duration_sum
+FROM {{table}}
+WHERE start_time >= '{{start_date}}'
+AND end_time <= '{{end_date}}'
+GROUP BY ST_SnapToGrid(location::geometry, {{grid_size}});
@@ -0,0 +1,8 @@
+-- /heatmap 'raw' mode, one row per stop
+SELECT
+    ST_Y(location::geometry) as latitude,
+    ST_X(location::geometry) as longitude,
+    duration_minutes
+FROM {{table}}
+WHERE start_time >= '{{start_date}}'
+AND end_time <= '{{end_date}}';
@@ -0,0 +1,8 @@
+-- /location without a zoom level. The viewport is a lat/lon rectangle, so it is
+-- compared as geometry: && uses the GiST index on location::geometry and
+-- ST_Intersects is the exact test.
+SELECT *
+FROM {{table}}
+WHERE location::geometry && ST_MakeEnvelope({{west}}, {{south}}, {{east}}, {{north}}, 4326)
+AND ST_Intersects(location::geometry, ST_MakeEnvelope({{west}}, {{south}}, {{east}}, {{north}}, 4326))
+LIMIT 10;
@@ -0,0 +1,9 @@
+-- /location with a zoom level, counts the points in view per grid cell of cell_size degrees
+SELECT
+    FLOOR(ST_X(location::geometry) / {{cell_size}})::int as cell_x,
+    FLOOR(ST_Y(location::geometry) / {{cell_size}})::int as cell_y,
+    COUNT(*) as count
+FROM {{table}}
+WHERE location::geometry && ST_MakeEnvelope({{west}}, {{south}}, {{east}}, {{north}}, 4326)
+AND ST_Intersects(location::geometry, ST_MakeEnvelope({{west}}, {{south}}, {{east}}, {{north}}, 4326))
+GROUP BY cell_x, cell_y;
@@ -0,0 +1,10 @@
+-- The raw points of the routes in qualifying_trucks, capped at 1000
+SELECT
+    r.route_id,
+    r.timestamp,
+    ST_Y(r.location::geometry) as latitude,
+    ST_X(r.location::geometry) as longitude
+FROM {{month_prefix}}_routes r
+INNER JOIN qualifying_trucks qt ON r.route_id = qt.route_id
+ORDER BY r.route_id, r.timestamp
+LIMIT 1000;
@@ -0,0 +1,17 @@
+-- Every route in qualifying_trucks whole, from the shapes precomputed by
+-- simplify_routes.py at the coarsest tolerance still below pixel_degrees
+SELECT
+    s.route_id,
+    ST_M(p.geom)::bigint as timestamp,
+    ST_Y(p.geom) as latitude,
+    ST_X(p.geom) as longitude
+FROM {{month_prefix}}_route_shapes s
+INNER JOIN qualifying_trucks qt ON s.route_id = qt.route_id
+CROSS JOIN LATERAL ST_DumpPoints(s.geom) p
+WHERE s.tolerance = COALESCE(
+    (SELECT MAX(tolerance) FROM {{month_prefix}}_route_shapes WHERE tolerance <= {{pixel_degrees}}),
+    (SELECT MIN(tolerance) FROM {{month_prefix}}_route_shapes)
+)
+-- single point routes are stored as a line to themselves
+AND p.path[1] <= s.point_count
+ORDER BY s.route_id, p.path[1];
@@ -0,0 +1,8 @@
+-- /trip_stats. Per-route statistics are computed by the route loader, so this is an
+-- index scan on start_time. truck_filter is '' or an AND clause on truck_id.
+SELECT *
+FROM {{month_prefix}}_route_stats
+WHERE start_time BETWEEN EXTRACT(EPOCH FROM '{{start_date}}'::timestamp)::bigint
+                    AND EXTRACT(EPOCH FROM '{{end_date}}'::timestamp)::bigint
+  {{truck_filter}}
+ORDER BY {{order_by}} DESC NULLS LAST;
@@ -0,0 +1,12 @@
+-- /from_utah and /to_utah. start_utah and end_utah are '' or 'NOT' to select routes
+-- starting or ending inside or outside Utah, route_points is route_points.sql or
+-- route_points_zoom.sql reading the qualifying_trucks CTE.
+WITH qualifying_trucks AS (
+    SELECT route_id
+    FROM {{month_prefix}}_route_summary
+    WHERE {{start_utah}} start_region_ids @> ARRAY[(SELECT id FROM regions WHERE name = 'Utah')]
+      AND {{end_utah}} end_region_ids @> ARRAY[(SELECT id FROM regions WHERE name = 'Utah')]
+      AND start_time BETWEEN EXTRACT(EPOCH FROM '{{start_date}}'::timestamp)::bigint
+                        AND EXTRACT(EPOCH FROM '{{end_date}}'::timestamp)::bigint
+)
+{{route_points}}